@@ -1,7 +1,7 @@
 from django.contrib import admin
 
-from blog.models import ( EntryEnvelope, Profile, Comment, Tag, View,
-                         Interaction, VisitorProfile )
+from blog.models import ( EntryEnvelope, EntryHead, Profile, Comment, Tag, View,
+                         Interaction, VisitorProfile, SyncOutbox, ArchivedEntryEnvelope )
 
 
 class ProfileAdmin(admin.ModelAdmin):
@@ -40,6 +40,27 @@ class EntryAdmin(admin.ModelAdmin):
     get_usable_email.admin_order_field = 'author__email'
     get_usable_email.short_description = 'Email'
 
+
+class EntryHeadAdmin(admin.ModelAdmin):
+    list_display = ('entry_id', 'slug', 'published', 'modified_on')
+    readonly_fields = ('entry_id', 'envelope', 'published_envelope', 'slug', 'published_slug',
+                       'create_date', 'published', 'modified_on')
+    search_fields = ['slug']
+
+
+class SyncOutboxAdmin(admin.ModelAdmin):
+    list_display = ('entry_id', 'status', 'attempts', 'next_attempt_at', 'created_on', 'sent_on', 'latency_ms')
+    list_filter = ('status',)
+    readonly_fields = ('entry_id', 'envelope', 'idempotency_key', 'lease_expires_on', 'created_on', 'sent_on', 'latency_ms')
+
+
+class ArchivedEntryEnvelopeAdmin(admin.ModelAdmin):
+    list_display = ('entry_id', 'title', 'version', 'created_on', 'archived_on')
+    readonly_fields = ('id', 'entry_id', 'author', 'entry', 'title', 'slug', 'version', 'published',
+                       'publish_date', 'create_date', 'edit_date', 'created_on', 'archived_on')
+    search_fields = ['title', 'slug']
+
+
 class VisitorProfileAdmin(admin.ModelAdmin):
     fieldsets = [
         (None, {'fields': ['session_uid', 'user', 'name', 'family', 'version', 'device', 'language', 'os_version']}),
@@ -96,6 +117,9 @@ class InteractionAdmin(admin.ModelAdmin):
 
 admin.site.register(Profile, ProfileAdmin)
 admin.site.register(EntryEnvelope, EntryAdmin)
+admin.site.register(EntryHead, EntryHeadAdmin)
+admin.site.register(SyncOutbox, SyncOutboxAdmin)
+admin.site.register(ArchivedEntryEnvelope, ArchivedEntryEnvelopeAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(View, ViewAdmin)
@@ -0,0 +1,151 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from blog import stats
+from blog.conf import get_setting
+
+
+KEY_PREFIX = 'tcb_blog:'
+GENERATION_KEY = KEY_PREFIX + 'generation'
+
+
+class LocalLRU(object):
+    """
+    Small per process LRU that sits in front of the shared cache.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.data:
+                return None
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+local = LocalLRU(get_setting('CACHE_LOCAL_MAX_ENTRIES'))
+
+
+def is_enabled():
+    return get_setting('CACHE_ENABLED')
+
+
+def shared():
+    return caches[get_setting('CACHE_ALIAS')]
+
+
+def current_generation():
+    generation = shared().get(GENERATION_KEY)
+    if generation is None:
+        generation = int(time.time() * 1000)
+        if not shared().add(GENERATION_KEY, generation, None):
+            generation = shared().get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    # Lists are keyed on the generation, and local entries are only trusted
+    # while it is unchanged, so this is what other processes see.
+    try:
+        shared().incr(GENERATION_KEY)
+    except ValueError:
+        shared().set(GENERATION_KEY, int(time.time() * 1000), None)
+
+
+def make_key(kind, value, generation=None):
+    key = KEY_PREFIX + kind + ':'
+    if generation is not None:
+        key += str(generation) + ':'
+    return key + hashlib.md5(str(value).encode('utf-8')).hexdigest()
+
+
+def fetch(kind, value, generational=False):
+    """
+    Returns (hit, data) for a cached value, checking the local tier first.
+    """
+    generation = current_generation()
+    key = make_key(kind, value, generation if generational else None)
+
+    cached = local.get(key)
+    if cached is not None and cached[0] == generation:
+        stats.incr('cache.hit.local')
+        return True, cached[1]
+
+    cached = shared().get(key)
+    if cached is not None:
+        stats.incr('cache.hit.shared')
+        local.set(key, (generation, cached))
+        return True, cached
+
+    stats.incr('cache.miss')
+    return False, None
+
+
+def store(kind, value, data, generational=False):
+    generation = current_generation()
+    key = make_key(kind, value, generation if generational else None)
+    shared().set(key, data, get_setting('CACHE_TIMEOUT'))
+    local.set(key, (generation, data))
+
+
+def cached_response(kind, value, build, generational=False):
+    """
+    Serves a view's response data from the cache, calling build() on a miss.
+
+    Entry and slug responses are dropped precisely when the entry changes,
+    generational ones (lists) whenever any published entry changes.
+    """
+    if not is_enabled():
+        return build()
+
+    hit, data = fetch(kind, value, generational)
+    if hit:
+        return Response(data, status=status.HTTP_200_OK)
+
+    response = build()
+    if response.status_code == status.HTTP_200_OK:
+        store(kind, value, response.data, generational)
+    return response
+
+
+def invalidate_entry(entry_id, slugs=()):
+    if not is_enabled():
+        return
+    entry_id = str(uuid.UUID(str(entry_id)))
+
+    def invalidate():
+        keys = [make_key('entry', entry_id)] + [make_key('slug', slug) for slug in slugs if slug]
+        shared().delete_many(keys)
+        for key in keys:
+            local.delete(key)
+        bump_generation()
+        stats.incr('cache.invalidations')
+
+    transaction.on_commit(invalidate)
@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from blog.conf import get_setting
+from blog.models import EntryHead
+
+
+TOKEN_SALT = 'blog.changes'
+
+
+def issue_token(modified_on, head_id):
+    return signing.dumps([modified_on.isoformat(), head_id], salt=TOKEN_SALT, compress=True)
+
+
+def read_token(token):
+    """
+    Returns the (modified_on, head id) position a token was issued for. Raises
+    signing.BadSignature or ValueError for tokens this server did not issue.
+    """
+    modified_on, head_id = signing.loads(token, salt=TOKEN_SALT)
+    modified_on = parse_datetime(modified_on)
+    if modified_on is None:
+        raise ValueError('Invalid token')
+    return modified_on, int(head_id)
+
+
+def changes_since(position, limit):
+    """
+    Heads changed after position, oldest first, as (heads, has_more, token).
+
+    Heads touched in the last SYNC_SETTLE_SECONDS are held back until the next
+    call, so a transaction that commits late can't slip in behind a token.
+    """
+    settled = timezone.now() - timedelta(seconds=get_setting('SYNC_SETTLE_SECONDS'))
+    heads = EntryHead.objects.filter(modified_on__lt=settled)
+    if position is not None:
+        modified_on, head_id = position
+        heads = heads.filter(Q(modified_on__gt=modified_on) | Q(modified_on=modified_on, id__gt=head_id))
+    heads = list(heads.order_by('modified_on', 'id').only(
+        'id', 'entry_id', 'published', 'published_envelope_id', 'modified_on'
+    )[:limit + 1])
+
+    has_more = len(heads) > limit
+    heads = heads[:limit]
+    if heads:
+        token = issue_token(heads[-1].modified_on, heads[-1].id)
+    elif position is not None:
+        token = issue_token(*position)
+    else:
+        token = None
+    return heads, has_more, token
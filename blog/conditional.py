@@ -0,0 +1,42 @@
+import hashlib
+from calendar import timegm
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+
+from blog import stats
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest())
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    Returns a 304 response if the request's validators still match, otherwise None.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if last_modified is not None:
+        last_modified = timegm(last_modified.utctimetuple())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        stats.incr('conditional.not_modified')
+    return response
+
+
+def conditional_response(request, etag, last_modified, build):
+    """
+    Answers 304 Not Modified without calling build() when the client is up to date.
+    """
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+
+    response = build()
+    if response.status_code == status.HTTP_200_OK:
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(timegm(last_modified.utctimetuple()))
+    return response
@@ -0,0 +1,90 @@
+from django.conf import settings
+
+
+USE_DEFAULTS = False
+
+
+DEFAULTS = {
+    'RSS_FEED_TITLE': 'Blog Feed',
+    'RSS_FEED_LINK': '/blog/',
+    'RSS_FEED_ITEM_DESC_TEMPLATE': 'feed/entries.html',
+    'RSS_FEED_ITEM_LIMIT': 50,
+    # Seconds to keep the rendered feed in the CACHE_ALIAS cache, 0 to always render it
+    'RSS_FEED_CACHE_TIMEOUT': 3600,
+    # 'exact' counts View rows for each page, 'counter' reads the denormalized EntryHead.view_count
+    'VIEW_COUNT_MODE': 'exact',
+    # Cursor pagination for entry and comment listings
+    'PAGINATE_BY_DEFAULT': False,
+    'PAGE_SIZE': 50,
+    'MAX_PAGE_SIZE': 500,
+    # Response cache for published entry reads
+    'CACHE_ENABLED': False,
+    'CACHE_ALIAS': 'default',
+    'CACHE_TIMEOUT': 300,
+    'CACHE_LOCAL_MAX_ENTRIES': 256,
+    # 'on_commit' reconciles older versions when the save commits, 'debounced'
+    # runs one Celery task per entry at most every PUBLISH_RECONCILE_WINDOW seconds
+    'PUBLISH_RECONCILE_MODE': 'on_commit',
+    'PUBLISH_RECONCILE_WINDOW': 10,
+    # 'poll' publishes scheduled entries from the publish_entries_if_scheduled beat task,
+    # 'eta' also queues a publish_scheduled_entry task for the exact publish time
+    'SCHEDULED_PUBLISH_MODE': 'poll',
+    # How side effect stages of the EntryEnvelope save pipeline run: 'sync', 'thread' or 'celery'
+    'PIPELINE_STAGE_MODES': {
+        'publish_states': 'sync',
+        'sync': 'celery',
+    },
+    'PIPELINE_THREAD_POOL_SIZE': 4,
+    'PIPELINE_DEBOUNCE_WINDOW': 5,
+    # Outbound sync to the authors' TheCodeBlogs profile URLs
+    'REMOTE_SYNC_TIMEOUT': 10,
+    'REMOTE_SYNC_RETRIES': 3,
+    'REMOTE_SYNC_BACKOFF': 0.5,
+    'REMOTE_SYNC_POOL_SIZE': 10,
+    'REMOTE_SYNC_BATCH_SIZE': 1,
+    'REMOTE_SYNC_MAX_CONCURRENCY': 4,
+    'REMOTE_SYNC_MAX_ATTEMPTS': 10,
+    'REMOTE_SYNC_DRAIN_BATCH': 200,
+    # Seconds before a failed sync is retried, doubled per attempt up to the max
+    'REMOTE_SYNC_RETRY_DELAY': 30,
+    'REMOTE_SYNC_RETRY_MAX_DELAY': 3600,
+    # Seconds a drainer owns the rows it is sending
+    'REMOTE_SYNC_LEASE': 300,
+    # Delta sync through entries/changes/
+    'SYNC_PAGE_SIZE': 200,
+    'SYNC_SETTLE_SECONDS': 5,
+    # 'full' stores every version's entry JSON, 'delta' a snapshot every
+    # SNAPSHOT_INTERVAL versions and JSON patches in between
+    'VERSION_STORAGE': 'full',
+    'SNAPSHOT_INTERVAL': 10,
+    # Retention for the archive_defunct_versions task
+    'ARCHIVE_KEEP_VERSIONS': 20,
+    'ARCHIVE_KEEP_DAYS': 30,
+    'ARCHIVE_BATCH_SIZE': 500,
+    'ARCHIVE_MAX_BATCHES': 100,
+    # 'direct' writes each view in the request, 'buffered' queues it for a
+    # background flusher that writes batches with bulk_create
+    'VIEW_INGEST_MODE': 'direct',
+    'VIEW_BUFFER_FLUSH_SIZE': 200,
+    'VIEW_BUFFER_FLUSH_MS': 500,
+    'VIEW_BUFFER_MAX_SIZE': 5000,
+    # Keep daily HyperLogLog sketches of each entry's distinct visitors as views are recorded
+    'UNIQUE_VISITORS_ENABLED': False,
+    # Most interactions accepted by one interactions/batch/ request
+    'INTERACTION_BATCH_MAX': 100,
+    # 'session' keeps anonymous visitor ids in request.session, 'cookie' in a signed cookie
+    'VISITOR_ID_MODE': 'session',
+    'VISITOR_ID_COOKIE_NAME': 'tcb_visitor_id',
+    'VISITOR_ID_COOKIE_AGE': 60 * 60 * 24 * 365,
+}
+
+
+if not hasattr(settings, 'TCB_BLOG_SETTINGS'):
+    USE_DEFAULTS = True
+
+
+def get_setting(setting, USE_DEFAULTS=USE_DEFAULTS):
+    if USE_DEFAULTS:
+        return DEFAULTS.get(setting)
+    else:
+        return settings.TCB_BLOG_SETTINGS.get(setting, DEFAULTS.get(setting))
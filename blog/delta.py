@@ -0,0 +1,84 @@
+"""
+Minimal JSON Patch (RFC 6902) support: add, remove and replace operations,
+which is all make_patch ever emits.
+"""
+import copy
+
+
+def escape(token):
+    return str(token).replace('~', '~0').replace('/', '~1')
+
+
+def unescape(token):
+    return token.replace('~1', '/').replace('~0', '~')
+
+
+def make_patch(source, target, path=''):
+    """
+    Returns the operations that turn source into target.
+    """
+    if type(source) is not type(target):
+        return [{'op': 'replace', 'path': path, 'value': target}]
+
+    if isinstance(source, dict):
+        operations = []
+        for key in source:
+            if key not in target:
+                operations.append({'op': 'remove', 'path': path + '/' + escape(key)})
+        for key, value in target.items():
+            if key not in source:
+                operations.append({'op': 'add', 'path': path + '/' + escape(key), 'value': value})
+            else:
+                operations.extend(make_patch(source[key], value, path + '/' + escape(key)))
+        return operations
+
+    if isinstance(source, list):
+        operations = []
+        for index in range(min(len(source), len(target))):
+            operations.extend(make_patch(source[index], target[index], path + '/' + str(index)))
+        for index in range(len(source), len(target)):
+            operations.append({'op': 'add', 'path': path + '/' + str(index), 'value': target[index]})
+        for index in range(len(source) - 1, len(target) - 1, -1):
+            operations.append({'op': 'remove', 'path': path + '/' + str(index)})
+        # An insert near the front shifts everything after it, resending the list is smaller then
+        if len(operations) > len(target):
+            return [{'op': 'replace', 'path': path, 'value': target}]
+        return operations
+
+    if source != target:
+        return [{'op': 'replace', 'path': path, 'value': target}]
+    return []
+
+
+def apply_patch(document, operations):
+    """
+    Returns a copy of document with operations applied.
+    """
+    document = copy.deepcopy(document)
+    for operation in operations:
+        path = operation['path']
+        value = copy.deepcopy(operation.get('value'))
+        if path == '':
+            document = value
+            continue
+
+        tokens = [unescape(token) for token in path.split('/')[1:]]
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        key = tokens[-1]
+
+        if isinstance(parent, list):
+            index = len(parent) if key == '-' else int(key)
+            if operation['op'] == 'add':
+                parent.insert(index, value)
+            elif operation['op'] == 'remove':
+                del parent[index]
+            else:
+                parent[index] = value
+        else:
+            if operation['op'] == 'remove':
+                del parent[key]
+            else:
+                parent[key] = value
+    return document
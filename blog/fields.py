@@ -0,0 +1,53 @@
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+from blog.delta import apply_patch
+
+
+class VersionedEntryDescriptor(DeferredAttribute):
+    """
+    Reads the stored entry, or rebuilds it from the snapshot and JSON patch
+    when the row only stores a delta.
+
+    Defines __set__ so it is a data descriptor. Otherwise the NULL that model
+    init puts in the instance __dict__ would shadow __get__ on delta rows.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if value is None and getattr(instance, self.field.delta_attname) is not None:
+            base = getattr(instance, self.field.base_attname)
+            value = apply_patch(getattr(base, self.field.attname), getattr(instance, self.field.delta_attname))
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        # Replaces whatever was stored or rebuilt before
+        instance.__dict__[self.field.attname] = value
+
+
+class VersionedJSONField(models.JSONField):
+    """
+    JSONField that leaves the column NULL on rows stored as a delta against a snapshot.
+    """
+    descriptor_class = VersionedEntryDescriptor
+    delta_attname = 'entry_delta'
+    base_attname = 'delta_base'
+
+    def pre_save(self, model_instance, add):
+        if getattr(model_instance, self.delta_attname) is not None:
+            return None
+        return super().pre_save(model_instance, add)
+
+
+def materialize_deltas(collector, field, sub_objs, using):
+    """
+    on_delete handler for delta_base: deltas of a deleted snapshot get their full entry back.
+    """
+    for envelope in sub_objs:
+        type(envelope)._base_manager.using(using).filter(pk=envelope.pk).update(
+            entry=envelope.entry, entry_delta=None
+        )
+    collector.add_field_update(field, None, sub_objs)
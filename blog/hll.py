@@ -0,0 +1,54 @@
+"""
+HyperLogLog cardinality sketches.
+
+With PRECISION 12 a sketch is 4096 one byte registers and estimates the
+number of distinct values with a standard error of 1.04 / sqrt(4096), about
+1.6%, however many values were added. Sketches of the same precision merge
+by taking the larger of each register, so daily sketches add up to weekly ones.
+"""
+import hashlib
+import math
+
+
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+RELATIVE_ERROR = 1.04 / math.sqrt(REGISTERS)
+ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+HASH_BITS = 64
+
+
+class HyperLogLog(object):
+
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers) if registers else bytearray(REGISTERS)
+        if len(self.registers) != REGISTERS:
+            raise ValueError('Expected %d registers, got %d' % (REGISTERS, len(self.registers)))
+
+    def add(self, value):
+        """
+        Adds value, returns True if the sketch changed.
+        """
+        digest = hashlib.sha1(str(value).encode('utf-8')).digest()
+        hashed = int.from_bytes(digest[:8], 'big')
+        index = hashed >> (HASH_BITS - PRECISION)
+        rest = hashed & ((1 << (HASH_BITS - PRECISION)) - 1)
+        rank = HASH_BITS - PRECISION - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other):
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def count(self):
+        estimate = ALPHA * REGISTERS * REGISTERS / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        # Linear counting is more accurate while most registers are still empty
+        if estimate <= 2.5 * REGISTERS and zeros:
+            estimate = REGISTERS * math.log(REGISTERS / float(zeros))
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes(self.registers)
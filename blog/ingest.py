@@ -0,0 +1,188 @@
+import atexit
+import logging
+import threading
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from blog import stats
+from blog.conf import get_setting
+from blog.models import EntryHead, update_unique_visitors
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer(object):
+    """
+    Collects rows in memory and hands them to write() in batches from a
+    background thread, every flush_size rows or flush_interval seconds.
+
+    Holds at most max_size rows. A caller that fills it up flushes inline,
+    so a slow database pushes back on requests instead of growing memory.
+    """
+
+    def __init__(self, name, write, flush_size, flush_interval, max_size):
+        self.name = name
+        self.write = write
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.items = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.closed = False
+
+    def add(self, item):
+        with self.lock:
+            self.items.append(item)
+            size = len(self.items)
+            # Started lazily, and again in forked workers where the parent's thread does not exist
+            if not self.closed and (self.thread is None or not self.thread.is_alive()):
+                self.thread = threading.Thread(target=self.run, name='tcb-blog-%s-flusher' % self.name, daemon=True)
+                self.thread.start()
+        stats.incr('ingest.%s.buffered' % self.name)
+        if size >= self.max_size or self.closed:
+            stats.incr('ingest.%s.inline_flushes' % self.name)
+            self.flush()
+        elif size >= self.flush_size:
+            self.wakeup.set()
+
+    def run(self):
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not flush the %s buffer', self.name)
+            finally:
+                connection.close()
+
+    def flush(self):
+        with self.lock:
+            batch, self.items = self.items, []
+        if not batch:
+            return 0
+        try:
+            self.write(batch)
+        except Exception:
+            stats.incr('ingest.%s.dropped' % self.name, len(batch))
+            raise
+        stats.incr('ingest.%s.flushes' % self.name)
+        stats.incr('ingest.%s.written' % self.name, len(batch))
+        return len(batch)
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=max(self.flush_interval * 2, 1))
+        self.flush()
+
+
+INSERT_BATCH_SIZE = 1000
+
+
+def insert_or_ignore(objs):
+    """
+    Inserts model instances with INSERT ... ON CONFLICT DO NOTHING RETURNING,
+    so rows that would break a unique constraint are skipped in the same
+    round trip. The instances need their primary key set already. Save
+    signals do not fire. Returns the instances that were inserted.
+    """
+    if not objs:
+        return []
+    meta = type(objs[0])._meta
+    fields = meta.concrete_fields
+    table = connection.ops.quote_name(meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    placeholders = '(%s)' % ', '.join(['%s'] * len(fields))
+
+    inserted_pks = set()
+    for start in range(0, len(objs), INSERT_BATCH_SIZE):
+        batch = objs[start:start + INSERT_BATCH_SIZE]
+        params = [field.get_db_prep_save(field.pre_save(obj, True), connection) for obj in batch for field in fields]
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO %s (%s) VALUES %s ON CONFLICT DO NOTHING RETURNING %s' % (
+                table, columns, ', '.join([placeholders] * len(batch)), connection.ops.quote_name(meta.pk.column)
+            ), params)
+            inserted_pks.update(row[0] for row in cursor.fetchall())
+
+    inserted = [obj for obj in objs if obj.pk in inserted_pks]
+    for obj in inserted:
+        obj._state.adding = False
+    return inserted
+
+
+def insert_views(views):
+    """
+    Inserts views, letting the unique constraints drop repeat views of an
+    envelope by the same session or user. Returns the views that were new.
+    """
+    inserted = insert_or_ignore(views)
+    stats.incr('views.duplicates', len(views) - len(inserted))
+    bump_view_counts(inserted)
+    update_unique_visitors(inserted)
+    return inserted
+
+
+def record_views(views):
+    """
+    Writes a batch of buffered views. Falls back to one insert per view when
+    an envelope went away since its views were buffered, keeping the rest.
+    """
+    try:
+        with transaction.atomic():
+            return insert_views(views)
+    except IntegrityError:
+        inserted = []
+        for view in views:
+            try:
+                with transaction.atomic():
+                    inserted.extend(insert_views([view]))
+            except IntegrityError:
+                logger.info('Dropped view of missing envelope %s', view.entry_envelope_id)
+        return inserted
+
+
+def bump_view_counts(views):
+    counts = {}
+    for view in views:
+        if view.entry_id is not None:
+            counts[view.entry_id] = counts.get(view.entry_id, 0) + 1
+    for entry_id, count in counts.items():
+        EntryHead.objects.filter(entry_id=entry_id).update(view_count=F('view_count') + count)
+
+
+_view_buffer = None
+_view_buffer_lock = threading.Lock()
+
+
+def view_buffer():
+    global _view_buffer
+    with _view_buffer_lock:
+        if _view_buffer is None:
+            _view_buffer = WriteBehindBuffer(
+                'views',
+                record_views,
+                flush_size=get_setting('VIEW_BUFFER_FLUSH_SIZE'),
+                flush_interval=get_setting('VIEW_BUFFER_FLUSH_MS') / 1000.0,
+                max_size=get_setting('VIEW_BUFFER_MAX_SIZE'),
+            )
+            atexit.register(_view_buffer.close)
+        return _view_buffer
+
+
+def view_envelope_id(entry_id):
+    """
+    The envelope views of entry_id are recorded against, its live published
+    version, or None when the entry isn't published.
+    """
+    return EntryHead.objects.filter(entry_id=entry_id).values_list('published_envelope_id', flat=True).first()
+
+
+def buffer_view(view):
+    view_buffer().add(view)
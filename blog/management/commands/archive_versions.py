@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.conf import get_setting
+from blog.tasks import archivable_versions, archive_versions
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves retired entry versions past the ARCHIVE_KEEP_VERSIONS / ARCHIVE_KEEP_DAYS retention '
+        'policy to the archive table, one short transaction per batch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=get_setting('ARCHIVE_BATCH_SIZE'))
+        parser.add_argument('--dry-run', action='store_true', help='Only count the versions that would be archived')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write('%d versions would be archived' % archivable_versions().count())
+            return
+
+        start = time.perf_counter()
+        archived = 0
+        while True:
+            count = archive_versions(options['batch_size'])
+            archived += count
+            if count:
+                self.stdout.write('Archived %d versions' % archived)
+            if count < options['batch_size']:
+                break
+        self.stdout.write('Archived %d versions in %.1fs' % (archived, time.perf_counter() - start))
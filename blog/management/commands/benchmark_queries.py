@@ -0,0 +1,127 @@
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog.models import EntryEnvelope, EntryHead, Comment, View
+
+
+class Command(BaseCommand):
+    help = 'Seeds a benchmark dataset and prints query plans and latencies for the hot lookups.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help='Insert the benchmark dataset first')
+        parser.add_argument('--entries', type=int, default=500)
+        parser.add_argument('--versions', type=int, default=50)
+        parser.add_argument('--views', type=int, default=1000000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--no-plans', action='store_true', help='Only print latencies')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options)
+
+        head = EntryHead.objects.filter(published=True).select_related('published_envelope').first()
+        if head is None:
+            self.stderr.write('No published entries to benchmark against, run with --seed')
+            return
+        envelope = head.published_envelope
+        some_view = View.objects.filter(entry_envelope=envelope).exclude(session_uid=None).first()
+        session_uid = some_view.session_uid if some_view else uuid.uuid4()
+
+        queries = [
+            ('latest version by entry_id',
+             EntryEnvelope.objects.filter(entry_id=head.entry_id).order_by('-version')[:1]),
+            ('published by slug',
+             EntryEnvelope.objects.only_published().filter(slug=envelope.slug)[:1]),
+            ('published heads page',
+             EntryEnvelope.objects.published_heads()[:50]),
+            ('published by distinct on (pre head table)',
+             EntryEnvelope.objects.only_published().order_by('-create_date', 'entry_id', '-version')
+             .distinct('create_date', 'entry_id')[:50]),
+            ('due scheduled publishes',
+             EntryEnvelope.objects.filter(should_publish_in_future=True, defunct=False,
+                                          future_publish_date__lte=timezone.now())),
+            ('view dedup by session',
+             View.objects.filter(entry_envelope=envelope, session_uid=session_uid)[:1]),
+            ('view count by entry_id',
+             View.objects.filter(entry_id=head.entry_id).values('entry_id')),
+            ('approved comments for envelope',
+             Comment.objects.filter(entry_envelope=envelope, approved=True).order_by('-created_on')),
+        ]
+
+        self.stdout.write('%d envelopes, %d views, %d comments' % (
+            EntryEnvelope.objects.count(), View.objects.count(), Comment.objects.count()
+        ))
+        for name, queryset in queries:
+            timings = []
+            for i in range(options['repeat']):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                '%s: median %.2fms, p95 %.2fms' % (
+                    name, statistics.median(timings), sorted(timings)[int(len(timings) * 0.95) - 1]
+                )
+            ))
+            if not options['no_plans']:
+                self.stdout.write(queryset.explain(analyze=True, buffers=True))
+
+    def seed(self, options):
+        author, created = User.objects.get_or_create(username='tcb_blog_benchmark')
+        now = timezone.now()
+        batch_size = options['batch_size']
+
+        envelopes = []
+        for e in range(options['entries']):
+            entry_id = str(uuid.uuid4())
+            create_date = now - timedelta(days=e)
+            for v in range(1, options['versions'] + 1):
+                latest = v == options['versions']
+                envelopes.append(EntryEnvelope(
+                    author=author,
+                    entry_id=entry_id,
+                    entry={'id': entry_id, 'title': 'Benchmark %d' % e, 'version': v, 'sections': []},
+                    title='Benchmark %d' % e,
+                    slug='benchmark-%d' % e,
+                    version=v,
+                    published=latest,
+                    defunct=not latest,
+                    create_date=create_date,
+                    edit_date=create_date,
+                ))
+        # bulk_create skips the save signals, so heads are filled in below
+        EntryEnvelope.objects.bulk_create(envelopes, batch_size=batch_size)
+        live = [envelope for envelope in envelopes if envelope.published]
+        EntryHead.objects.bulk_create([
+            EntryHead(entry_id=envelope.entry_id, envelope=envelope, published_envelope=envelope,
+                      slug=envelope.slug, published_slug=envelope.slug,
+                      create_date=envelope.create_date, published=True)
+            for envelope in live
+        ], batch_size=batch_size)
+        self.stdout.write('Seeded %d envelopes' % len(envelopes))
+
+        remaining = options['views']
+        while remaining > 0:
+            chunk = min(batch_size, remaining)
+            views = []
+            for i in range(chunk):
+                envelope = live[(remaining - i) % len(live)]
+                views.append(View(entry_envelope=envelope, entry_id=envelope.entry_id, session_uid=uuid.uuid4()))
+            View.objects.bulk_create(views, batch_size=batch_size)
+            remaining -= chunk
+        self.stdout.write('Seeded %d views' % options['views'])
+
+        comments = [
+            Comment(entry_envelope=live[i % len(live)], user=author, content='Benchmark comment %d' % i,
+                    approved=i % 3 != 0)
+            for i in range(options['comments'])
+        ]
+        Comment.objects.bulk_create(comments, batch_size=batch_size)
+        self.stdout.write('Seeded %d comments' % options['comments'])
@@ -0,0 +1,100 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+
+from blog.conf import get_setting
+from blog.delta import make_patch
+from blog.models import EntryEnvelope, clear_stored_entries
+
+
+class Command(BaseCommand):
+    help = (
+        'Rewrites stored entry versions as a full snapshot every --interval versions with JSON patch deltas '
+        'in between, and prints the storage used and entry reconstruction latency before and after. '
+        'Run it with --interval 1 to store every version in full again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=get_setting('SNAPSHOT_INTERVAL'))
+        parser.add_argument('--entry', action='append', help='Only compact this entry_id, can be repeated')
+        parser.add_argument('--benchmark-only', action='store_true', help='Only print storage and latency')
+        parser.add_argument('--samples', type=int, default=100, help='Envelopes to load for the latency benchmark')
+
+    def handle(self, *args, **options):
+        self.report('Before', options['samples'])
+        if options['benchmark_only']:
+            return
+
+        entry_ids = options['entry'] or EntryEnvelope.objects.filter(entry_id__isnull=False).order_by() \
+            .values_list('entry_id', flat=True).distinct().iterator()
+        start = time.perf_counter()
+        entries = 0
+        snapshots = 0
+        deltas = 0
+        for entry_id in entry_ids:
+            with transaction.atomic():
+                entry_snapshots, entry_deltas = self.compact(entry_id, max(options['interval'], 1))
+            entries += 1
+            snapshots += entry_snapshots
+            deltas += entry_deltas
+        self.stdout.write('Compacted %d entries into %d snapshots and %d deltas in %.1fs' % (
+            entries, snapshots, deltas, time.perf_counter() - start
+        ))
+
+        self.report('After', options['samples'])
+
+    def compact(self, entry_id, interval):
+        versions = list(EntryEnvelope.objects.select_for_update(of=('self',)).filter(entry_id=entry_id)
+                        .select_related('delta_base').order_by(F('version').asc(nulls_first=True), 'created_on'))
+        entries = {envelope.pk: envelope.entry for envelope in versions}
+
+        snapshot = None
+        snapshots = 0
+        for envelope in versions:
+            if snapshot is None or envelope.version is None or envelope.version - snapshot.version >= interval:
+                envelope.entry_delta = None
+                envelope.delta_base = None
+                snapshot = envelope
+                snapshots += 1
+            else:
+                envelope.entry_delta = make_patch(entries[snapshot.pk], entries[envelope.pk])
+                envelope.delta_base = snapshot
+
+        # Snapshots get their full entry written first, then the deltas drop theirs
+        EntryEnvelope.objects.bulk_update(versions, ['entry', 'entry_delta', 'delta_base'])
+        clear_stored_entries(versions)
+        return snapshots, len(versions) - snapshots
+
+    def report(self, label, samples):
+        table = connection.ops.quote_name(EntryEnvelope._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT COUNT(*), COUNT(entry_delta), '
+                'COALESCE(SUM(pg_column_size(entry)), 0) + COALESCE(SUM(pg_column_size(entry_delta)), 0), '
+                'pg_total_relation_size(%%s::regclass) FROM %s' % table,
+                [EntryEnvelope._meta.db_table]
+            )
+            envelopes, deltas, entry_bytes, table_bytes = cursor.fetchone()
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            '%s: %d envelopes (%d deltas), entry JSON %.1f MB, table with indexes and toast %.1f MB' % (
+                label, envelopes, deltas, entry_bytes / 1048576.0, table_bytes / 1048576.0
+            )
+        ))
+
+        for kind, queryset in (('snapshots', EntryEnvelope.objects.filter(entry_delta__isnull=True)),
+                               ('deltas', EntryEnvelope.objects.filter(entry_delta__isnull=False))):
+            ids = list(queryset.order_by('?').values_list('pk', flat=True)[:samples])
+            if not ids:
+                continue
+            timings = []
+            for pk in ids:
+                started = time.perf_counter()
+                EntryEnvelope.objects.select_related('delta_base').get(pk=pk).entry
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write('%s: loading %d %s, median %.2fms, p95 %.2fms' % (
+                label, len(timings), kind, statistics.median(timings),
+                sorted(timings)[max(int(len(timings) * 0.95) - 1, 0)]
+            ))
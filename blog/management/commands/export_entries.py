@@ -0,0 +1,71 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from blog.delta import apply_patch
+from blog.models import EntryEnvelope
+
+
+class Command(BaseCommand):
+    help = 'Streams entry envelopes out as NDJSON, one envelope per line.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help='File to write to, defaults to stdout')
+        parser.add_argument('--heads-only', action='store_true', help='Only export the latest version of each entry')
+        parser.add_argument('--published-only', action='store_true', help='Only export live published versions')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['published_only']:
+            envelopes = EntryEnvelope.objects.published_heads() if options['heads_only'] else \
+                EntryEnvelope.objects.only_published()
+        elif options['heads_only']:
+            envelopes = EntryEnvelope.objects.heads()
+        else:
+            envelopes = EntryEnvelope.objects.all()
+        envelopes = envelopes.order_by('entry_id', 'version').values_list(
+            'id', 'author__username', 'created_on', 'published', 'defunct', 'future_publish_processed_on', 'entry',
+            'entry_delta', 'delta_base_id'
+        )
+        # Snapshots of the entry being exported, delta versions are patched onto them
+        snapshots = {}
+
+        # self.stdout rather than sys.stdout, so call_command(stdout=...) can capture the export
+        output = open(options['output'], 'w', encoding='utf-8') if options['output'] else None
+        start = time.perf_counter()
+        exported = 0
+        written = 0
+        try:
+            for envelope_id, author, created_on, published, defunct, processed_on, entry, delta, base_id in \
+                    envelopes.iterator(chunk_size=options['chunk_size']):
+                if entry is None and delta is not None:
+                    if base_id not in snapshots:
+                        snapshots = {base_id: EntryEnvelope.objects.values_list('entry', flat=True).get(pk=base_id)}
+                    entry = apply_patch(snapshots[base_id], delta)
+                elif delta is None:
+                    snapshots = {envelope_id: entry}
+                line = json.dumps({
+                    'id': envelope_id,
+                    'author': author,
+                    'created_on': created_on,
+                    'published': published,
+                    'defunct': defunct,
+                    'future_publish_processed_on': processed_on,
+                    'entry': entry,
+                }, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+                if output is None:
+                    self.stdout.write(line, ending='')
+                else:
+                    output.write(line)
+                exported += 1
+                written += len(line)
+        finally:
+            if output is not None:
+                output.close()
+
+        elapsed = time.perf_counter() - start
+        self.stderr.write('Exported %d envelopes (%.1f MB) in %.1fs, %.0f envelopes/s' % (
+            exported, written / 1048576.0, elapsed, exported / elapsed if elapsed else 0
+        ))
@@ -0,0 +1,100 @@
+import json
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from blog.models import EntryEnvelope, Tag, refresh_entry_head
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams NDJSON written by export_entries into the database with bulk inserts. '
+        'Save signals do not fire, so nothing is synced or reconciled, and tags and '
+        'heads are linked in bulk after each chunk.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', nargs='?', help='File to read, defaults to stdin')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--author', help='Username to import as when the exported author does not exist here')
+        parser.add_argument('--skip-existing', action='store_true', help='Ignore envelopes whose id already exists')
+
+    def handle(self, *args, **options):
+        self.authors = {}
+        self.fallback_author = None
+        if options['author']:
+            try:
+                self.fallback_author = User.objects.get(username=options['author'])
+            except User.DoesNotExist:
+                raise CommandError('No user named %s' % options['author'])
+
+        source = open(options['input'], encoding='utf-8') if options['input'] else sys.stdin
+        start = time.perf_counter()
+        imported = 0
+        entry_ids = set()
+        batch = []
+        try:
+            for number, line in enumerate(source, 1):
+                if not line.strip():
+                    continue
+                batch.append(self.build(json.loads(line), number))
+                if len(batch) >= options['chunk_size']:
+                    imported += self.flush(batch, entry_ids, options['skip_existing'])
+                    batch = []
+            if batch:
+                imported += self.flush(batch, entry_ids, options['skip_existing'])
+        finally:
+            if options['input']:
+                source.close()
+
+        for entry_id in entry_ids:
+            refresh_entry_head(entry_id)
+
+        elapsed = time.perf_counter() - start
+        self.stderr.write('Imported %d envelopes of %d entries in %.1fs, %.0f envelopes/s' % (
+            imported, len(entry_ids), elapsed, imported / elapsed if elapsed else 0
+        ))
+
+    def get_author(self, username, number):
+        if username not in self.authors:
+            self.authors[username] = User.objects.filter(username=username).first() or self.fallback_author
+        if self.authors[username] is None:
+            raise CommandError('Line %d: no user named %s, pass --author to import anyway' % (number, username))
+        return self.authors[username]
+
+    def build(self, record, number):
+        envelope = EntryEnvelope(
+            id=record['id'],
+            entry=record['entry'],
+            author=self.get_author(record.get('author'), number),
+        )
+        envelope.populate_stuff()
+        envelope.published = record.get('published', envelope.published)
+        envelope.defunct = record.get('defunct', False)
+        envelope.future_publish_processed_on = parse_datetime(record['future_publish_processed_on']) \
+            if record.get('future_publish_processed_on') else None
+        return envelope
+
+    def flush(self, batch, entry_ids, skip_existing):
+        Through = EntryEnvelope.tags.through
+        with transaction.atomic():
+            if skip_existing:
+                existing = set(EntryEnvelope.objects.filter(pk__in=[envelope.pk for envelope in batch])
+                               .values_list('pk', flat=True))
+                batch = [envelope for envelope in batch if envelope.pk not in existing]
+            EntryEnvelope.objects.bulk_create(batch)
+
+            labels = {envelope.pk: envelope.entry.get('tags') or [] for envelope in batch}
+            tags = Tag.objects.resolve(label for envelope_labels in labels.values() for label in envelope_labels)
+            Through.objects.bulk_create([
+                Through(entryenvelope_id=envelope_id, tag_id=tags[str(label)])
+                for envelope_id, envelope_labels in labels.items()
+                for label in set(envelope_labels) if label
+            ], ignore_conflicts=True)
+
+        entry_ids.update(str(envelope.entry_id) for envelope in batch if envelope.entry_id)
+        return len(batch)
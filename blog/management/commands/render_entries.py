@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.models import EntryEnvelope
+from blog.rendering import render_entry
+
+
+class Command(BaseCommand):
+    help = 'Fills in the pre-encoded JSON representation of entry envelopes that do not have one yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render every envelope, not only missing ones')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        envelopes = EntryEnvelope.objects.only('id', 'entry', 'entry_delta', 'delta_base_id', 'author_id').order_by()
+        if not options['all']:
+            envelopes = envelopes.filter(rendered__isnull=True)
+
+        start = time.perf_counter()
+        rendered = 0
+        batch = []
+        for envelope in envelopes.iterator(chunk_size=chunk_size):
+            envelope.rendered = render_entry(envelope)
+            batch.append(envelope)
+            if len(batch) >= chunk_size:
+                EntryEnvelope.objects.bulk_update(batch, ['rendered'])
+                rendered += len(batch)
+                batch = []
+        if batch:
+            EntryEnvelope.objects.bulk_update(batch, ['rendered'])
+            rendered += len(batch)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write('Rendered %d envelopes in %.1fs (%.0f/s)' % (
+            rendered, elapsed, rendered / elapsed if elapsed else 0
+        ))
@@ -0,0 +1,77 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count
+
+from blog.ingest import insert_views
+from blog.models import EntryHead, View
+
+
+class Command(BaseCommand):
+    help = (
+        'Records the same views from many threads at once and reports throughput and duplicates, '
+        'for the ON CONFLICT insert and for the old check-then-insert. The views are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=5000, help='View requests per mode')
+        parser.add_argument('--sessions', type=int, default=200, help='Distinct sessions the requests come from')
+
+    def handle(self, *args, **options):
+        head = EntryHead.objects.filter(envelope__isnull=False).select_related('envelope').first()
+        if head is None:
+            self.stderr.write('No entries to record views against')
+            return
+        self.envelope = head.envelope
+        sessions = [uuid.uuid4() for i in range(options['sessions'])]
+        requests = [sessions[i % len(sessions)] for i in range(options['requests'])]
+
+        for name, record in (('check-then-insert', self.check_then_insert), ('on conflict', self.on_conflict)):
+            self.errors = 0
+            self.lock = threading.Lock()
+            start = time.perf_counter()
+            chunks = [requests[i::options['threads']] for i in range(options['threads'])]
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                list(pool.map(lambda chunk: self.in_thread(record, chunk), chunks))
+            elapsed = time.perf_counter() - start
+
+            recorded = View.objects.filter(entry_envelope=self.envelope, session_uid__in=sessions)
+            duplicates = recorded.values('session_uid').annotate(count=Count('id')).filter(count__gt=1).count()
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                '%s: %d requests in %.2fs, %.0f/s, %d views for %d sessions, %d duplicated, %d constraint errors' % (
+                    name, len(requests), elapsed, len(requests) / elapsed, recorded.count(), len(sessions),
+                    duplicates, self.errors
+                )
+            ))
+            recorded.delete()
+        # Both paths bumped the head's counter for views that are gone again
+        EntryHead.objects.filter(pk=head.pk).update(view_count=head.view_count)
+
+    def in_thread(self, record, session_uids):
+        try:
+            for session_uid in session_uids:
+                record(session_uid)
+        finally:
+            connection.close()
+
+    def view(self, session_uid):
+        return View(entry_envelope=self.envelope, entry_id=self.envelope.entry_id, session_uid=session_uid)
+
+    def check_then_insert(self, session_uid):
+        if View.objects.filter(entry_envelope=self.envelope, session_uid=session_uid).count() > 0:
+            return
+        try:
+            with transaction.atomic():
+                self.view(session_uid).save()
+        except IntegrityError:
+            # The race the unique constraint now catches
+            with self.lock:
+                self.errors += 1
+
+    def on_conflict(self, session_uid):
+        insert_views([self.view(session_uid)])
@@ -1,12 +1,31 @@
-from django.db.models import QuerySet, Manager, Q
+import threading
+
+from django.db.models import QuerySet, Manager, Q, Max, Count, Sum
+from django.db.models.fields.json import KeyTextTransform
+
+STORED_DATE_KEYS = ('create_date', 'edit_date', 'publish_date')
+
 
 class EntriesQuerySet(QuerySet):
     def only_published(self):
         return self.filter(Q(published=True) & Q(defunct=False))
+    def heads(self):
+        # Latest version of every entry, resolved through the EntryHead table
+        return self.filter(head__isnull=False).order_by('-create_date', 'entry_id')
+    def published_heads(self):
+        # Live published version of every entry, resolved through the EntryHead table
+        return self.filter(published_head__published=True).order_by('-create_date', 'entry_id')
     def for_author(self, handle):
         return self.filter(author__handle=handle)
     def with_tags(self, tags):
         return self.filter(tag_set__in=tags)
+    def with_stored_dates(self):
+        # The entry JSON's date strings as stored_<key>, and for delta versions their snapshot's as base_<key>
+        annotations = {}
+        for key in STORED_DATE_KEYS:
+            annotations['stored_' + key] = KeyTextTransform(key, 'entry')
+            annotations['base_' + key] = KeyTextTransform(key, 'delta_base__entry')
+        return self.annotate(**annotations)
 
 
 class DefaultEntriesManager(Manager):
@@ -17,6 +36,12 @@ class DefaultEntriesManager(Manager):
     def only_published(self):
         return self.get_queryset().only_published()
 
+    def heads(self):
+        return self.get_queryset().heads()
+
+    def published_heads(self):
+        return self.get_queryset().published_heads()
+
     def for_author(self, handle):
         return self.get_queryset().for_author(handle)
 
@@ -24,6 +49,72 @@ class DefaultEntriesManager(Manager):
         return self.get_queryset().with_tags(tags)
 
 
+class EntryHeadManager(Manager):
+
+    def watermark(self, views=False):
+        """
+        (latest head change, number of live heads), which changes whenever the published set does.
+        With views, the live heads' total view count is added for responses that show the counts.
+        """
+        aggregates = {
+            'modified_on': Max('modified_on'),
+            'live': Count('id', filter=Q(published=True)),
+        }
+        if views:
+            aggregates['views'] = Sum('view_count', filter=Q(published=True))
+        result = self.get_queryset().aggregate(**aggregates)
+        if views:
+            return result['modified_on'], result['live'], result['views'] or 0
+        return result['modified_on'], result['live']
+
+
+class TagManager(Manager):
+    # In process label -> id cache shared by every TagManager
+    label_cache = {}
+    label_cache_lock = threading.Lock()
+    label_cache_max_entries = 10000
+
+    def resolve(self, labels):
+        """
+        Returns {label: id} for labels, inserting the missing tags in bulk.
+        """
+        labels = set(str(label) for label in labels if label)
+        with self.label_cache_lock:
+            resolved = {label: self.label_cache[label] for label in labels if label in self.label_cache}
+
+        if resolved:
+            # Other processes may have deleted tags since they were cached, check by primary key
+            present = set(self.get_queryset().filter(pk__in=resolved.values()).values_list('pk', flat=True))
+            stale = [label for label, pk in resolved.items() if pk not in present]
+            if stale:
+                with self.label_cache_lock:
+                    for label in stale:
+                        self.label_cache.pop(label, None)
+                for label in stale:
+                    del resolved[label]
+
+        missing = labels - set(resolved)
+        if missing:
+            found = dict(self.get_queryset().filter(label__in=missing).values_list('label', 'id'))
+            if len(found) < len(missing):
+                self.bulk_create(
+                    [self.model(label=label) for label in missing - set(found)], ignore_conflicts=True
+                )
+                found = dict(self.get_queryset().filter(label__in=missing).values_list('label', 'id'))
+            resolved.update(found)
+
+            with self.label_cache_lock:
+                if len(self.label_cache) + len(found) > self.label_cache_max_entries:
+                    self.label_cache.clear()
+                self.label_cache.update(found)
+
+        return resolved
+
+    def forget(self):
+        with self.label_cache_lock:
+            self.label_cache.clear()
+
+
 class CommentQuerySet(QuerySet):
 
     def public(self):
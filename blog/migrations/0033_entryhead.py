@@ -0,0 +1,52 @@
+# Generated by Django 3.1.2 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+
+
+def populate_entry_heads(apps, schema_editor):
+    EntryEnvelope = apps.get_model('blog', 'EntryEnvelope')
+    EntryHead = apps.get_model('blog', 'EntryHead')
+
+    entry_ids = EntryEnvelope.objects.filter(entry_id__isnull=False).values_list('entry_id', flat=True).distinct()
+    for entry_id in entry_ids.iterator():
+        versions = EntryEnvelope.objects.filter(entry_id=entry_id).order_by(
+            F('version').desc(nulls_last=True), '-created_on'
+        )
+        latest = versions.first()
+        live = versions.filter(published=True, defunct=False).first()
+        EntryHead.objects.create(
+            entry_id=entry_id,
+            envelope=latest,
+            published_envelope=live,
+            slug=latest.slug,
+            published_slug=live.slug if live else None,
+            create_date=latest.create_date,
+            published=live is not None,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0032_auto_20210625_1353'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntryHead',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_id', models.UUIDField(unique=True)),
+                ('slug', models.TextField(null=True)),
+                ('published_slug', models.TextField(null=True)),
+                ('create_date', models.DateTimeField(null=True)),
+                ('published', models.BooleanField(default=False)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+                ('envelope', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='head', to='blog.entryenvelope')),
+                ('published_envelope', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='published_head', to='blog.entryenvelope')),
+            ],
+        ),
+        migrations.RunPython(populate_entry_heads, migrations.RunPython.noop),
+    ]
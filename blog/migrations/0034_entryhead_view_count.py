@@ -0,0 +1,31 @@
+# Generated by Django 3.1.2 on 2026-10-18 10:03
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_view_counts(apps, schema_editor):
+    EntryHead = apps.get_model('blog', 'EntryHead')
+    View = apps.get_model('blog', 'View')
+
+    counts = View.objects.filter(entry_id__isnull=False).values('entry_id').annotate(
+        view_count=Count('id')
+    ).values_list('entry_id', 'view_count')
+    for entry_id, view_count in counts.iterator():
+        EntryHead.objects.filter(entry_id=entry_id).update(view_count=view_count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0033_entryhead'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entryhead',
+            name='view_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_view_counts, migrations.RunPython.noop),
+    ]
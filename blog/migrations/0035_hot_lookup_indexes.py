@@ -0,0 +1,53 @@
+# Generated by Django 3.1.2 on 2026-10-18 11:27
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Indexes are built CONCURRENTLY so large tables stay writable during the migration
+    atomic = False
+
+    dependencies = [
+        ('blog', '0034_entryhead_view_count'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='entryenvelope',
+            index=models.Index(fields=['entry_id', '-version'], name='blog_entry_entry_ver_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='entryenvelope',
+            index=models.Index(fields=['slug'], name='blog_entry_slug_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='entryenvelope',
+            index=models.Index(fields=['published', 'defunct'], name='blog_entry_pub_defunct_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='entryenvelope',
+            index=models.Index(condition=models.Q(('defunct', False), ('published', True)), fields=['entry_id', '-version'], name='blog_entry_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='entryenvelope',
+            index=models.Index(condition=models.Q(('defunct', False), ('should_publish_in_future', True)), fields=['future_publish_date'], name='blog_entry_future_pub_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='comment',
+            index=models.Index(fields=['entry_envelope', 'approved', 'created_on'], name='blog_comment_env_appr_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='view',
+            index=models.Index(fields=['entry_envelope', 'session_uid'], name='blog_view_env_session_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='view',
+            index=models.Index(fields=['entry_envelope', 'user'], name='blog_view_env_user_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='view',
+            index=models.Index(fields=['entry_id'], name='blog_view_entry_id_idx'),
+        ),
+    ]
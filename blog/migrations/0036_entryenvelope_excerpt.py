@@ -0,0 +1,35 @@
+# Generated by Django 3.1.2 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+from blog.rendering import build_excerpt
+
+
+def populate_excerpts(apps, schema_editor):
+    EntryEnvelope = apps.get_model('blog', 'EntryEnvelope')
+
+    batch = []
+    for envelope in EntryEnvelope.objects.only('id', 'entry').iterator(chunk_size=500):
+        envelope.excerpt = build_excerpt(envelope.entry)
+        batch.append(envelope)
+        if len(batch) >= 500:
+            EntryEnvelope.objects.bulk_update(batch, ['excerpt'])
+            batch = []
+    if batch:
+        EntryEnvelope.objects.bulk_update(batch, ['excerpt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0035_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entryenvelope',
+            name='excerpt',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.RunPython(populate_excerpts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.2 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0036_entryenvelope_excerpt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entryenvelope',
+            name='rendered',
+            field=models.BinaryField(editable=False, null=True),
+        ),
+    ]
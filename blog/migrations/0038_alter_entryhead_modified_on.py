@@ -0,0 +1,18 @@
+# Generated by Django 3.1.2 on 2026-10-18 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0037_entryenvelope_rendered'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='entryhead',
+            name='modified_on',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.1.2 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+from blog.rendering import build_feed_description
+
+
+def populate_feed_descriptions(apps, schema_editor):
+    EntryEnvelope = apps.get_model('blog', 'EntryEnvelope')
+
+    batch = []
+    for envelope in EntryEnvelope.objects.filter(published=True, defunct=False).only('id', 'entry').iterator(chunk_size=500):
+        envelope.feed_description = build_feed_description(envelope.entry)
+        batch.append(envelope)
+        if len(batch) >= 500:
+            EntryEnvelope.objects.bulk_update(batch, ['feed_description'])
+            batch = []
+    if batch:
+        EntryEnvelope.objects.bulk_update(batch, ['feed_description'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0038_alter_entryhead_modified_on'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entryenvelope',
+            name='feed_description',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.RunPython(populate_feed_descriptions, migrations.RunPython.noop),
+    ]
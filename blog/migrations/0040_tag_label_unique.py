@@ -0,0 +1,46 @@
+# Generated by Django 3.1.2 on 2026-10-18 16:48
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    Tag = apps.get_model('blog', 'Tag')
+    EntryEnvelope = apps.get_model('blog', 'EntryEnvelope')
+    Through = EntryEnvelope.tags.through
+
+    duplicates = Tag.objects.values('label').annotate(count=Count('id'), keep=Min('id')).filter(count__gt=1)
+    for duplicate in duplicates:
+        keep = duplicate['keep']
+        others = list(Tag.objects.filter(label=duplicate['label']).exclude(id=keep).values_list('id', flat=True))
+        tagged = Through.objects.filter(tag_id=keep).values('entryenvelope_id')
+        Through.objects.filter(tag_id__in=others, entryenvelope_id__in=tagged).delete()
+        # An envelope can still hold two of the duplicates, keep one link each
+        seen = set()
+        for link in Through.objects.filter(tag_id__in=others).order_by('id'):
+            if link.entryenvelope_id in seen:
+                link.delete()
+            else:
+                seen.add(link.entryenvelope_id)
+        Through.objects.filter(tag_id__in=others).update(tag_id=keep)
+        Tag.objects.filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0039_entryenvelope_feed_description'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+        # Run the deferred foreign key checks queued by the deletes now, postgres
+        # refuses to ALTER a table with pending trigger events
+        migrations.RunSQL('SET CONSTRAINTS ALL IMMEDIATE', 'SET CONSTRAINTS ALL DEFERRED'),
+        migrations.AlterField(
+            model_name='tag',
+            name='label',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.RunSQL('SET CONSTRAINTS ALL DEFERRED', 'SET CONSTRAINTS ALL IMMEDIATE'),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0040_tag_label_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncOutbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_id', models.UUIDField()),
+                ('idempotency_key', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('superseded', 'Superseded'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('sent_on', models.DateTimeField(blank=True, null=True)),
+                ('latency_ms', models.FloatField(blank=True, null=True)),
+                ('envelope', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='blog.entryenvelope')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='syncoutbox',
+            index=models.Index(fields=['status', 'entry_id'], name='blog_outbox_status_entry_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:40
+
+import blog.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0041_syncoutbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='entryenvelope',
+            name='entry',
+            field=blog.fields.VersionedJSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='entryenvelope',
+            name='entry_delta',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='entryenvelope',
+            name='delta_base',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=blog.fields.materialize_deltas, related_name='deltas', to='blog.entryenvelope'),
+        ),
+    ]
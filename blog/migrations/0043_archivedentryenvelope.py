@@ -0,0 +1,38 @@
+# Generated by Django 3.1.2 on 2026-10-18 19:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('blog', '0042_entryenvelope_delta_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedEntryEnvelope',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('entry_id', models.UUIDField(blank=True, null=True)),
+                ('entry', models.JSONField()),
+                ('title', models.TextField(null=True)),
+                ('slug', models.TextField(null=True)),
+                ('version', models.IntegerField(blank=True, null=True)),
+                ('published', models.BooleanField(default=False)),
+                ('publish_date', models.DateTimeField(null=True)),
+                ('create_date', models.DateTimeField(null=True)),
+                ('edit_date', models.DateTimeField(null=True)),
+                ('created_on', models.DateTimeField()),
+                ('archived_on', models.DateTimeField(auto_now_add=True)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedentryenvelope',
+            index=models.Index(fields=['entry_id', '-version'], name='blog_archive_entry_ver_idx'),
+        ),
+    ]
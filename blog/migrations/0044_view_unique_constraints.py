@@ -0,0 +1,56 @@
+# Generated by Django 3.1.2 on 2026-10-18 20:15
+
+from django.db import migrations, models
+
+
+def delete_duplicate_views(apps, schema_editor):
+    View = apps.get_model('blog', 'View')
+    EntryHead = apps.get_model('blog', 'EntryHead')
+    quote = schema_editor.connection.ops.quote_name
+    views = quote(View._meta.db_table)
+
+    deleted = 0
+    with schema_editor.connection.cursor() as cursor:
+        # Keep the first view of each envelope and session or user
+        for column in ('session_uid', 'user_id'):
+            cursor.execute(
+                'DELETE FROM {views} later USING {views} earlier '
+                'WHERE later.entry_envelope_id = earlier.entry_envelope_id '
+                'AND later.{column} = earlier.{column} '
+                'AND (later.created_on, later.id) > (earlier.created_on, earlier.id)'.format(
+                    views=views, column=quote(column)
+                )
+            )
+            deleted += cursor.rowcount
+        if deleted:
+            cursor.execute(
+                'UPDATE {heads} SET view_count = (SELECT COUNT(*) FROM {views} WHERE {views}.entry_id = {heads}.entry_id)'
+                .format(heads=quote(EntryHead._meta.db_table), views=views)
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0043_archivedentryenvelope'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_views, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='view',
+            name='blog_view_env_session_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='view',
+            name='blog_view_env_user_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='view',
+            constraint=models.UniqueConstraint(fields=('entry_envelope', 'session_uid'), name='blog_view_env_session_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='view',
+            constraint=models.UniqueConstraint(fields=('entry_envelope', 'user'), name='blog_view_env_user_uniq'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.1.2 on 2026-10-18 21:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0044_view_unique_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UniqueVisitorSketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_id', models.UUIDField()),
+                ('day', models.DateField()),
+                ('registers', models.BinaryField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='uniquevisitorsketch',
+            constraint=models.UniqueConstraint(fields=('entry_id', 'day'), name='blog_sketch_entry_day_uniq'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 3.1.2 on 2026-10-18 21:48
+
+import hashlib
+import json
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+FINGERPRINT_FIELDS = ('name', 'family', 'version', 'device', 'os_version')
+
+
+def fingerprint_profiles(apps, schema_editor):
+    VisitorProfile = apps.get_model('blog', 'VisitorProfile')
+
+    batch = []
+    for profile in VisitorProfile.objects.only('id', *FINGERPRINT_FIELDS).iterator(chunk_size=2000):
+        values = [getattr(profile, field) for field in FINGERPRINT_FIELDS]
+        profile.fingerprint = hashlib.sha256(json.dumps(values).encode('utf-8')).hexdigest()
+        batch.append(profile)
+        if len(batch) >= 2000:
+            VisitorProfile.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    if batch:
+        VisitorProfile.objects.bulk_update(batch, ['fingerprint'])
+
+    # Keep the first profile of each session or user and browser
+    quote = schema_editor.connection.ops.quote_name
+    with schema_editor.connection.cursor() as cursor:
+        for column, condition in (('session_uid', 'later.user_id IS NULL AND earlier.user_id IS NULL'),
+                                  ('user_id', 'later.user_id IS NOT NULL')):
+            cursor.execute(
+                'DELETE FROM {profiles} later USING {profiles} earlier '
+                'WHERE later.{column} = earlier.{column} AND later.fingerprint = earlier.fingerprint '
+                'AND {condition} AND (later.created_on, later.id) > (earlier.created_on, earlier.id)'.format(
+                    profiles=quote(VisitorProfile._meta.db_table), column=quote(column), condition=condition
+                )
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0045_uniquevisitorsketch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visitorprofile',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(fingerprint_profiles, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='visitorprofile',
+            constraint=models.UniqueConstraint(condition=Q(user__isnull=True), fields=('session_uid', 'fingerprint'), name='blog_visitor_session_fp_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='visitorprofile',
+            constraint=models.UniqueConstraint(condition=Q(user__isnull=False), fields=('user', 'fingerprint'), name='blog_visitor_user_fp_uniq'),
+        ),
+    ]
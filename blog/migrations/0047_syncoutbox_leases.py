@@ -0,0 +1,28 @@
+# Generated by Django 3.1.2 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0046_visitorprofile_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncoutbox',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='syncoutbox',
+            name='lease_expires_on',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='syncoutbox',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('superseded', 'Superseded'), ('failed', 'Failed')], default='pending', max_length=16),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.1.2 on 2026-10-18 22:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0047_syncoutbox_leases'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='entryhead',
+            name='envelope',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='head', to='blog.entryenvelope'),
+        ),
+    ]
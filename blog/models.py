@@ -1,11 +1,15 @@
 import hashlib
+import threading
 import uuid
+import weakref
 from datetime import datetime
 
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models.signals import pre_save, post_save
+from django.db import models, transaction
+from django.db.models import F, Q, Count, Subquery
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from backend.celery import app
 
@@ -16,7 +20,13 @@ from pygments.formatters.html import HtmlFormatter
 from pygments.lexers.data import JsonLexer
 import logging
 
-from blog.managers import DefaultEntriesManager, DefaultCommentManager
+from blog import cache, stats
+from blog.conf import get_setting
+from blog.delta import apply_patch, make_patch
+from blog.fields import VersionedJSONField, materialize_deltas
+from blog.hll import HyperLogLog
+from blog.managers import DefaultEntriesManager, DefaultCommentManager, EntryHeadManager, TagManager
+from blog.rendering import build_excerpt, build_feed_description, render_entry
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -60,7 +70,14 @@ def save_user_profile(sender, instance, **kwargs):
 
 
 class Tag(models.Model):
-    label = models.CharField(max_length=255, null=False, blank=False)
+    label = models.CharField(max_length=255, null=False, blank=False, unique=True)
+
+    objects = TagManager()
+
+
+@receiver(post_delete, sender=Tag)
+def tag_post_delete(sender, instance, *args, **kwargs):
+    Tag.objects.forget()
 
 
 class EntryEnvelope(models.Model):
@@ -73,9 +90,23 @@ class EntryEnvelope(models.Model):
         on_delete=models.CASCADE,
         related_name="author"
     )
-    entry = models.JSONField()
+    # NULL when the version is stored as entry_delta, a JSON patch against delta_base
+    entry = VersionedJSONField(null=True)
+    entry_delta = models.JSONField(null=True, blank=True, editable=False)
+    delta_base = models.ForeignKey(
+        'self',
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=materialize_deltas,
+        related_name="deltas"
+    )
     title = models.TextField(null=True)
     slug = models.TextField(null=True)
+    excerpt = models.TextField(null=True, blank=True)
+    feed_description = models.TextField(null=True, blank=True)
+    # Public JSON representation without the view count, encoded at save time
+    rendered = models.BinaryField(null=True, editable=False)
 
     tags = models.ManyToManyField(Tag, related_name="entries")
 
@@ -122,6 +153,8 @@ class EntryEnvelope(models.Model):
         self.edit_date = self.entry.get('edit_date')
         self.entry_id = self.entry.get('id')
         self.slug = self.entry.get('slug')
+        self.excerpt = build_excerpt(self.entry)
+        self.feed_description = build_feed_description(self.entry)
         self.published = self.entry.get('published')
         self.publish_date = self.entry.get('publish_date')
         self.version = self.entry.get('version')
@@ -129,38 +162,310 @@ class EntryEnvelope(models.Model):
         self.should_publish_in_future = self.entry.get('should_publish_in_future')
         self.future_publish_date = self.entry.get('future_publish_date')
 
-        tags = self.entry.get('tags')
-        if tags:
-            for entry_tag in tags:
-                tag, created = Tag.objects.get_or_create(label=entry_tag)
+        self.rendered = render_entry(self)
 
     class Meta:
         abstract = False
+        indexes = [
+            models.Index(fields=['entry_id', '-version'], name='blog_entry_entry_ver_idx'),
+            models.Index(fields=['slug'], name='blog_entry_slug_idx'),
+            models.Index(fields=['published', 'defunct'], name='blog_entry_pub_defunct_idx'),
+            models.Index(fields=['entry_id', '-version'], name='blog_entry_live_idx',
+                         condition=Q(published=True, defunct=False)),
+            models.Index(fields=['future_publish_date'], name='blog_entry_future_pub_idx',
+                         condition=Q(should_publish_in_future=True, defunct=False)),
+        ]
+
+
+class EntryHead(models.Model):
+    """
+    One row per entry_id pointing at its latest and its live published version.
+
+    Maintained from the save pipeline so list and lookup requests don't have to
+    work out the latest version over every EntryEnvelope row.
+    """
+    entry_id = models.UUIDField(unique=True)
+    # Null once every version is deleted, the head stays behind as a tombstone for changes/
+    envelope = models.OneToOneField(
+        EntryEnvelope,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="head"
+    )
+    published_envelope = models.OneToOneField(
+        EntryEnvelope,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="published_head"
+    )
+    slug = models.TextField(null=True)
+    published_slug = models.TextField(null=True)
+    create_date = models.DateTimeField(null=True)
+    published = models.BooleanField(null=False, default=False)
+    modified_on = models.DateTimeField(auto_now=True, db_index=True)
+    view_count = models.PositiveIntegerField(null=False, default=0)
+
+    objects = EntryHeadManager()
+
+
+def refresh_entry_head(entry_id, touched=None):
+    if entry_id is None:
+        return None
+
+    versions = EntryEnvelope.objects.filter(entry_id=entry_id).order_by(
+        F('version').desc(nulls_last=True), '-created_on'
+    ).only('id', 'slug', 'create_date')
+    latest = versions.first()
+    if latest is None:
+        # Keep a tombstone so sync clients see the delete
+        EntryHead.objects.filter(entry_id=entry_id).update(
+            envelope=None, published_envelope=None, published_slug=None, published=False,
+            modified_on=timezone.now()
+        )
+        cache.invalidate_entry(entry_id)
+        return None
+
+    live = versions.only_published().first()
+    if cache.is_enabled():
+        # Only a change to the live version is visible to cached public reads
+        previous = EntryHead.objects.filter(entry_id=entry_id).values_list(
+            'published_envelope_id', 'published_slug'
+        ).first() or (None, None)
+        live_id = live.pk if live else None
+        if previous[0] != live_id or (touched is not None and touched == live_id):
+            cache.invalidate_entry(entry_id, [previous[1], live.slug if live else None])
+    head, created = EntryHead.objects.update_or_create(
+        entry_id=entry_id,
+        defaults={
+            'envelope': latest,
+            'published_envelope': live,
+            'slug': latest.slug,
+            'published_slug': live.slug if live else None,
+            'create_date': latest.create_date,
+            'published': live is not None,
+        }
+    )
+    return head
+
+
+def rebase_deltas(snapshot):
+    """
+    Rewrites the deltas stored against snapshot for its new entry, before it is saved.
+    """
+    previous = EntryEnvelope.objects.filter(pk=snapshot.pk).values_list('entry', flat=True).first()
+    if previous is None or previous == snapshot.entry:
+        return
+    deltas = list(EntryEnvelope.objects.filter(delta_base=snapshot).only('id', 'entry_delta'))
+    for envelope in deltas:
+        envelope.entry_delta = make_patch(snapshot.entry, apply_patch(previous, envelope.entry_delta))
+    EntryEnvelope.objects.bulk_update(deltas, ['entry_delta'])
+
+
+def compress_entry(envelope, delta=True):
+    """
+    Picks how a version is stored when VERSION_STORAGE is 'delta': a full
+    snapshot every SNAPSHOT_INTERVAL versions, a JSON patch against the last
+    snapshot in between. Snapshots that deltas point at stay snapshots.
+
+    delta=False always stores the version in full, for bulk writes that may
+    change a snapshot and its deltas in the same batch.
+    """
+    entry = envelope.entry
+    envelope.entry_delta = None
+    envelope.delta_base = None
+    if not envelope._state.adding and EntryEnvelope.objects.filter(delta_base=envelope).exists():
+        rebase_deltas(envelope)
+        return
+    if not delta or get_setting('VERSION_STORAGE') != 'delta' or envelope.entry_id is None or envelope.version is None:
+        return
+
+    base = EntryEnvelope.objects.filter(
+        entry_id=envelope.entry_id, delta_base__isnull=True, entry__isnull=False, version__lt=envelope.version
+    ).exclude(pk=envelope.pk).order_by('-version').only('id', 'version', 'entry').first()
+    if base is None or envelope.version - base.version >= get_setting('SNAPSHOT_INTERVAL'):
+        return
+
+    envelope.entry_delta = make_patch(base.entry, entry)
+    envelope.delta_base = base
+    stats.incr('versions.delta')
+
+
+def clear_stored_entries(envelopes):
+    """
+    Drops the full entry of delta versions written with bulk_update, which always writes it.
+    """
+    delta_ids = [envelope.pk for envelope in envelopes if envelope.entry_delta is not None]
+    if delta_ids:
+        EntryEnvelope.objects.filter(pk__in=delta_ids).update(entry=None)
 
 
 @receiver(pre_save, sender=EntryEnvelope)
 def entry_pre_save(sender, instance, *args, **kwargs):
     instance.populate_stuff()
+    compress_entry(instance)
+
+
+def reconcile_publish_states(entry_id):
+    """
+    Marks every version older than the latest published one unpublished and defunct, in one UPDATE.
+    """
+    live_version = EntryEnvelope.objects.filter(entry_id=entry_id).only_published().order_by(
+        F('version').desc(nulls_last=True)
+    ).values('version')[:1]
+    updated = EntryEnvelope.objects.filter(entry_id=entry_id, version__lt=Subquery(live_version)).filter(
+        Q(published=True) | Q(defunct=False) | Q(should_publish_in_future=True)
+    ).update(published=False, defunct=True, should_publish_in_future=False)
+    logger.info('Marked %d other versions unpublished for %s', updated, entry_id)
+    stats.incr('publish.reconcile.runs')
+    return updated
+
+
+@app.task(name="reconcile_publish_states")
+def reconcile_publish_states_task(entry_id):
+    reconcile_publish_states(entry_id)
 
 
 @app.task(name="make_all_other_entries_unpublished")
 def manage_publish_states(entry_envelope_id):
+    # Kept for tasks queued before reconciliation moved to schedule_publish_reconciliation
     ee = EntryEnvelope.objects.get(pk=entry_envelope_id)
-    entry_id = ee.entry_id
-    logger.info('Marking all other entries unpublished for %s', entry_id)
-    all_other_entries = EntryEnvelope.objects.filter(entry_id=entry_id, version__lt=ee.version).exclude(id=entry_envelope_id)
-    all_other_entries.update(published=False, defunct=True, should_publish_in_future=False)
+    reconcile_publish_states(ee.entry_id)
+
+
+# Reconciliations waiting on the current transaction of this thread's connections.
+# Held weakly, so the callbacks a rollback discards drop out of it by themselves.
+pending_reconciliations = threading.local()
+
+
+def get_pending_reconciliations():
+    if not hasattr(pending_reconciliations, 'callbacks'):
+        pending_reconciliations.callbacks = weakref.WeakValueDictionary()
+    return pending_reconciliations.callbacks
+
+
+class PublishReconciliation(object):
+    """
+    on_commit callback that reconciles one entry, either right away or
+    debounced through Celery depending on PUBLISH_RECONCILE_MODE.
+    """
+
+    def __init__(self, entry_id, using=None):
+        self.entry_id = entry_id
+        self.key = (using, entry_id)
+
+    def __call__(self):
+        get_pending_reconciliations().pop(self.key, None)
+        if get_setting('PUBLISH_RECONCILE_MODE') == 'debounced':
+            window = get_setting('PUBLISH_RECONCILE_WINDOW')
+            # Saves inside the window ride along with the task that is already waiting
+            if cache.shared().add(cache.make_key('reconcile', self.entry_id), 1, window):
+                reconcile_publish_states_task.apply_async(args=[self.entry_id], countdown=window)
+            else:
+                stats.incr('publish.reconcile.coalesced')
+        else:
+            reconcile_publish_states(self.entry_id)
+
+
+def schedule_publish_reconciliation(entry_id, using=None):
+    entry_id = str(entry_id)
+    connection = transaction.get_connection(using)
+    callback = PublishReconciliation(entry_id, connection.alias)
+    if connection.in_atomic_block:
+        pending = get_pending_reconciliations()
+        if callback.key in pending:
+            stats.incr('publish.reconcile.coalesced')
+            return
+        pending[callback.key] = callback
+    stats.incr('publish.reconcile.scheduled')
+    transaction.on_commit(callback, using)
+
+
+@receiver(post_delete, sender=EntryEnvelope)
+def entry_post_delete(sender, instance, *args, **kwargs):
+    refresh_entry_head(instance.entry_id)
+
+
+class SyncOutbox(models.Model):
+    """
+    Pending remote syncs, written in the same transaction as the envelope save.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    SUPERSEDED = 'superseded'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (SUPERSEDED, 'Superseded'),
+        (FAILED, 'Failed'),
+    )
 
+    entry_id = models.UUIDField()
+    envelope = models.ForeignKey(
+        EntryEnvelope,
+        on_delete=models.CASCADE,
+        related_name="outbox"
+    )
+    idempotency_key = models.CharField(max_length=64)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    # Failed rows are not retried before this
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    # A drainer owns a 'sending' row until this, then another may take it over
+    lease_expires_on = models.DateTimeField(null=True, blank=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+    sent_on = models.DateTimeField(null=True, blank=True)
+    # Time from the save to the confirmed delivery
+    latency_ms = models.FloatField(null=True, blank=True)
 
-@receiver(post_save, sender=EntryEnvelope)
-def entry_post_save(sender, instance, *args, **kwargs):
-    tags = instance.entry.get('tags')
-    if tags:
-        for entry_tag in tags:
-            tag, created = Tag.objects.get_or_create(label=entry_tag)
-            instance.tags.add(tag)
-    if instance.published:
-        manage_publish_states.delay(str(instance.id))
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'entry_id'], name='blog_outbox_status_entry_idx'),
+        ]
+
+
+def enqueue_sync(envelope):
+    """
+    Adds envelope to the outbox, superseding anything still pending for its entry.
+    """
+    key = hashlib.sha256(str(envelope.pk).encode('utf-8') + bytes(envelope.rendered or b'')).hexdigest()
+    SyncOutbox.objects.filter(entry_id=envelope.entry_id, status=SyncOutbox.PENDING).update(
+        status=SyncOutbox.SUPERSEDED
+    )
+    return SyncOutbox.objects.create(entry_id=envelope.entry_id, envelope=envelope, idempotency_key=key)
+
+
+class ArchivedEntryEnvelope(models.Model):
+    """
+    Retired versions moved out of the EntryEnvelope table by the archiver, with the full entry JSON.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    entry_id = models.UUIDField(null=True, blank=True)
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="archived_entries"
+    )
+    entry = models.JSONField()
+    title = models.TextField(null=True)
+    slug = models.TextField(null=True)
+    version = models.IntegerField(null=True, blank=True)
+    published = models.BooleanField(null=False, default=False)
+    publish_date = models.DateTimeField(null=True)
+    create_date = models.DateTimeField(null=True)
+    edit_date = models.DateTimeField(null=True)
+    created_on = models.DateTimeField()
+    archived_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['entry_id', '-version'], name='blog_archive_entry_ver_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -180,6 +485,11 @@ class Comment(models.Model):
 
     objects = DefaultCommentManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['entry_envelope', 'approved', 'created_on'], name='blog_comment_env_appr_idx'),
+        ]
+
 
 class View(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -198,6 +508,116 @@ class View(models.Model):
     )
     session_uid = models.UUIDField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['entry_id'], name='blog_view_entry_id_idx'),
+        ]
+        # One view per envelope and session or user, enforced by the database
+        constraints = [
+            models.UniqueConstraint(fields=['entry_envelope', 'session_uid'], name='blog_view_env_session_uniq'),
+            models.UniqueConstraint(fields=['entry_envelope', 'user'], name='blog_view_env_user_uniq'),
+        ]
+
+
+@receiver(post_save, sender=View)
+def view_post_save(sender, instance, created, *args, **kwargs):
+    if created and instance.entry_id is not None:
+        EntryHead.objects.filter(entry_id=instance.entry_id).update(view_count=F('view_count') + 1)
+
+
+def get_view_counts(entry_ids):
+    """
+    Returns {str(entry_id): view count} for all of entry_ids in a single query.
+    """
+    entry_ids = [str(entry_id) for entry_id in entry_ids if entry_id is not None]
+    if not entry_ids:
+        return {}
+
+    if get_setting('VIEW_COUNT_MODE') == 'counter':
+        counts = EntryHead.objects.filter(entry_id__in=entry_ids).values_list('entry_id', 'view_count')
+    else:
+        counts = View.objects.filter(entry_id__in=entry_ids).values('entry_id').annotate(
+            view_count=Count('id')
+        ).values_list('entry_id', 'view_count')
+    return {str(entry_id): view_count for entry_id, view_count in counts}
+
+
+@app.task(name="reconcile_view_counts")
+def reconcile_view_counts():
+    # The counter is only ever incremented, so resync it from the View table now and then
+    counts = dict(View.objects.filter(entry_id__isnull=False).values('entry_id').annotate(
+        view_count=Count('id')
+    ).values_list('entry_id', 'view_count'))
+    for head in EntryHead.objects.only('id', 'entry_id', 'view_count').iterator():
+        view_count = counts.get(head.entry_id, 0)
+        if head.view_count != view_count:
+            EntryHead.objects.filter(pk=head.pk).update(view_count=view_count)
+
+
+class UniqueVisitorSketch(models.Model):
+    """
+    HyperLogLog sketch of the sessions and users that viewed an entry on one day.
+    """
+    entry_id = models.UUIDField()
+    day = models.DateField()
+    registers = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['entry_id', 'day'], name='blog_sketch_entry_day_uniq'),
+        ]
+
+
+def visitor_key(user_id, session_uid):
+    return 'u:%s' % user_id if user_id is not None else 's:%s' % session_uid
+
+
+def update_unique_visitors(views):
+    """
+    Adds the visitors of freshly inserted views to the entries' daily sketches.
+
+    Sketches are only written when a register grows, and merged under a row
+    lock so concurrent writers never lose each other's visitors.
+    """
+    if not get_setting('UNIQUE_VISITORS_ENABLED'):
+        return
+    visitors = {}
+    for view in views:
+        if view.entry_id is not None:
+            key = visitor_key(view.user_id, view.session_uid)
+            visitors.setdefault((view.entry_id, view.created_on.date()), []).append(key)
+
+    for (entry_id, day), keys in visitors.items():
+        stored = UniqueVisitorSketch.objects.filter(entry_id=entry_id, day=day).values_list('registers', flat=True).first()
+        sketch = HyperLogLog(stored)
+        changed = [sketch.add(key) for key in keys]
+        if stored is not None and not any(changed):
+            continue
+        merge_unique_visitor_sketch(entry_id, day, sketch)
+
+
+def merge_unique_visitor_sketch(entry_id, day, sketch):
+    """
+    Merges sketch into the stored sketch of entry_id and day, creating it if needed.
+    """
+    with transaction.atomic():
+        row, created = UniqueVisitorSketch.objects.get_or_create(
+            entry_id=entry_id, day=day, defaults={'registers': sketch.to_bytes()}
+        )
+        if not created:
+            row = UniqueVisitorSketch.objects.select_for_update().get(pk=row.pk)
+            row.registers = HyperLogLog(row.registers).merge(sketch).to_bytes()
+            row.save(update_fields=['registers'])
+
+
+def get_unique_visitor_sketches(entry_id, first_day, last_day):
+    """
+    Returns {day: HyperLogLog} for the days from first_day through last_day that had views.
+    """
+    return {day: HyperLogLog(registers) for day, registers in UniqueVisitorSketch.objects.filter(
+        entry_id=entry_id, day__range=(first_day, last_day)
+    ).values_list('day', 'registers')}
+
 
 class Interaction(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -236,6 +656,14 @@ class VisitorProfile(models.Model):
     minor = models.IntegerField(null=True,blank=True)
     patch = models.IntegerField(null=True,blank=True)
     language = models.TextField(null=True,blank=True)
+    # sha256 of the fields that tell one browser apart from another, see FINGERPRINT_FIELDS
+    fingerprint = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    FINGERPRINT_FIELDS = ('name', 'family', 'version', 'device', 'os_version')
+
+    def populate_fingerprint(self):
+        values = [getattr(self, field) for field in self.FINGERPRINT_FIELDS]
+        self.fingerprint = hashlib.sha256(json.dumps(values).encode('utf-8')).hexdigest()
 
     def telemetry_formatted(self):
         # dump the json with indentation set
@@ -258,3 +686,16 @@ class VisitorProfile(models.Model):
 
     telemetry.short_description = 'Telemetry Formatted'
 
+    class Meta:
+        # One profile per session or user and browser
+        constraints = [
+            models.UniqueConstraint(fields=['session_uid', 'fingerprint'], condition=Q(user__isnull=True),
+                                    name='blog_visitor_session_fp_uniq'),
+            models.UniqueConstraint(fields=['user', 'fingerprint'], condition=Q(user__isnull=False),
+                                    name='blog_visitor_user_fp_uniq'),
+        ]
+
+
+@receiver(pre_save, sender=VisitorProfile)
+def visitor_profile_pre_save(sender, instance, *args, **kwargs):
+    instance.populate_fingerprint()
@@ -0,0 +1,133 @@
+import base64
+import json
+from collections import OrderedDict
+from datetime import date, datetime
+from uuid import UUID
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from blog.conf import get_setting
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward only cursor pagination keyed on a tuple of columns.
+
+    Each page is fetched with a WHERE on the last row of the previous page
+    instead of an OFFSET, so deep pages cost the same as the first one. The
+    last field in ordering must be unique. Responses stay plain lists unless
+    the client asks for a cursor or page_size, or PAGINATE_BY_DEFAULT is set.
+    """
+    ordering = ()
+    page_size = get_setting('PAGE_SIZE')
+    max_page_size = get_setting('MAX_PAGE_SIZE')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.after(position))
+            except (ValidationError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def is_requested(self, request):
+        if get_setting('PAGINATE_BY_DEFAULT'):
+            return True
+        return (self.cursor_query_param in request.query_params or
+                self.page_size_query_param in request.query_params)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size < 1:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_fields(self):
+        return [(field.lstrip('-'), field.startswith('-')) for field in self.ordering]
+
+    def after(self, position):
+        # Row comparison (a, b) > (x, y) spelled out as OR-ed prefixes, so each
+        # branch can still use the composite index. Follows the postgres
+        # default of NULLS FIRST for descending and NULLS LAST for ascending.
+        condition = Q(pk__in=[])
+        prefix = Q()
+        for (field, descending), value in zip(self.get_fields(), position):
+            if value is None:
+                beyond = Q(**{field + '__isnull': False}) if descending else Q(pk__in=[])
+                equal = Q(**{field + '__isnull': True})
+            elif descending:
+                beyond = Q(**{field + '__lt': value})
+                equal = Q(**{field: value})
+            else:
+                beyond = Q(**{field + '__gt': value}) | Q(**{field + '__isnull': True})
+                equal = Q(**{field: value})
+            condition |= prefix & beyond
+            prefix &= equal
+        return condition
+
+    def encode_value(self, value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, UUID):
+            return str(value)
+        return value
+
+    def encode_cursor(self, item):
+        position = [self.encode_value(getattr(item, field)) for field, descending in self.get_fields()]
+        return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class EntryPagination(KeysetPagination):
+    ordering = ('-create_date', 'entry_id')
+
+
+class CommentPagination(KeysetPagination):
+    ordering = ('-created_on', 'id')
@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+from backend.celery import app
+
+from blog import cache, stats
+from blog.conf import get_setting
+from blog.models import EntryEnvelope, Profile, Tag, enqueue_sync, refresh_entry_head, schedule_publish_reconciliation
+from blog.remote_sync import drain_sync_outbox
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class PipelineContext(object):
+    """
+    Lookups shared by the stages of one pipeline run, each done at most once.
+    """
+
+    def __init__(self, envelope):
+        self.envelope = envelope
+        self._profile = None
+
+    @property
+    def profile(self):
+        if self._profile is None:
+            self._profile = Profile.objects.filter(user_id=self.envelope.author_id).only('token', 'url').first() or Profile()
+        return self._profile
+
+
+class Stage(object):
+    """
+    One step of the EntryEnvelope post_save pipeline.
+
+    applies() always runs inline. run() does the work, inline for core stages
+    and per PIPELINE_STAGE_MODES ('sync', 'thread' or 'celery') for side effects.
+    """
+
+    def __init__(self, name, run, applies=None, side_effect=False, debounce=False):
+        self.name = name
+        self.run = run
+        self.applies = applies or (lambda envelope, context: True)
+        self.side_effect = side_effect
+        # Celery runs of a debounced stage are coalesced per entry for PIPELINE_DEBOUNCE_WINDOW seconds
+        self.debounce = debounce
+
+    def mode(self):
+        if not self.side_effect:
+            return 'sync'
+        return get_setting('PIPELINE_STAGE_MODES').get(self.name, 'sync')
+
+
+def link_tags(envelope, context):
+    tags = Tag.objects.resolve(envelope.entry.get('tags') or [])
+    envelope.tags.set(tags.values())
+
+
+def refresh_head(envelope, context):
+    refresh_entry_head(envelope.entry_id, touched=envelope.pk)
+
+
+def is_published(envelope, context):
+    return bool(envelope.published and envelope.entry_id)
+
+
+def reconcile_publish_states(envelope, context):
+    schedule_publish_reconciliation(envelope.entry_id)
+
+
+def is_scheduled_for_eta(envelope, context):
+    return bool(get_setting('SCHEDULED_PUBLISH_MODE') == 'eta' and envelope.should_publish_in_future and
+                envelope.future_publish_date and not envelope.defunct and envelope.entry_id)
+
+
+def schedule_publish(envelope, context):
+    # populate_stuff copies the date straight out of the entry JSON
+    eta = envelope.future_publish_date
+    if isinstance(eta, str):
+        eta = parse_datetime(eta)
+    if eta is None:
+        return
+    entry_id = str(envelope.entry_id)
+    transaction.on_commit(lambda: app.send_task('publish_scheduled_entry', args=[entry_id], eta=eta))
+
+
+def should_sync(envelope, context):
+    return bool(envelope.published and context.profile.token)
+
+
+def write_outbox(envelope, context):
+    enqueue_sync(envelope)
+
+
+def sync_to_remote(envelope, context):
+    drain_sync_outbox(str(envelope.entry_id))
+
+
+STAGES = [
+    Stage('tags', link_tags),
+    Stage('head', refresh_head),
+    Stage('publish_states', reconcile_publish_states, applies=is_published, side_effect=True),
+    Stage('schedule', schedule_publish, applies=is_scheduled_for_eta),
+    Stage('outbox', write_outbox, applies=should_sync),
+    Stage('sync', sync_to_remote, applies=should_sync, side_effect=True, debounce=True),
+]
+
+STAGES_BY_NAME = {stage.name: stage for stage in STAGES}
+
+
+def timed(stage, envelope, context):
+    start = time.perf_counter()
+    try:
+        stage.run(envelope, context)
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        stats.incr('pipeline.%s.runs' % stage.name)
+        stats.incr('pipeline.%s.ms' % stage.name, elapsed)
+        logger.debug('Pipeline stage %s took %.1fms for %s', stage.name, elapsed, envelope.pk)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=get_setting('PIPELINE_THREAD_POOL_SIZE'),
+                                           thread_name_prefix='tcb-blog-pipeline')
+        return _executor
+
+
+def run_in_thread(stage, envelope, context):
+    try:
+        timed(stage, envelope, context)
+    except Exception:
+        logger.exception('Pipeline stage %s failed for %s', stage.name, envelope.pk)
+    finally:
+        connection.close()
+
+
+@app.task(name="run_entry_pipeline_stage")
+def run_entry_pipeline_stage(stage_name, entry_envelope_id):
+    envelope = EntryEnvelope.objects.get(pk=entry_envelope_id)
+    stage = STAGES_BY_NAME[stage_name]
+    timed(stage, envelope, PipelineContext(envelope))
+
+
+def dispatch(stage, envelope, context):
+    mode = stage.mode()
+    if mode == 'celery' and stage.debounce:
+        envelope_id = str(envelope.pk)
+        key = cache.make_key('pipeline:' + stage.name, envelope.entry_id)
+        window = get_setting('PIPELINE_DEBOUNCE_WINDOW')
+
+        def enqueue():
+            if cache.shared().add(key, 1, window):
+                run_entry_pipeline_stage.apply_async(args=[stage.name, envelope_id], countdown=window)
+            else:
+                stats.incr('pipeline.%s.coalesced' % stage.name)
+        transaction.on_commit(enqueue)
+    elif mode == 'celery':
+        envelope_id = str(envelope.pk)
+        transaction.on_commit(lambda: run_entry_pipeline_stage.delay(stage.name, envelope_id))
+    elif mode == 'thread':
+        transaction.on_commit(lambda: executor().submit(run_in_thread, stage, envelope, context))
+    else:
+        timed(stage, envelope, context)
+
+
+def run_post_save_pipeline(envelope, skip=()):
+    """
+    Runs every stage that applies to a freshly saved envelope, in order.
+    """
+    context = PipelineContext(envelope)
+    for stage in STAGES:
+        if stage.name not in skip and stage.applies(envelope, context):
+            dispatch(stage, envelope, context)
+    return context
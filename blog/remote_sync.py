@@ -0,0 +1,271 @@
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.db import transaction
+from django.db.models import Min, Q, Subquery
+from django.utils import timezone
+from backend.celery import app
+
+from blog import cache, stats
+from blog.conf import get_setting
+from blog.models import EntryEnvelope, SyncOutbox
+from blog.serializers import EntrySerializer
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+ENTRIES_PATH = '/api/entries/'
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def make_retry():
+    options = dict(
+        total=get_setting('REMOTE_SYNC_RETRIES'),
+        backoff_factor=get_setting('REMOTE_SYNC_BACKOFF'),
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False,
+    )
+    try:
+        return Retry(allowed_methods=None, **options)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=False, **options)
+
+
+class SyncClient(object):
+    """
+    Posts entries to one destination over a pooled keep-alive session.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=get_setting('REMOTE_SYNC_POOL_SIZE'),
+            max_retries=make_retry(),
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def post_entries(self, token, payloads, keys=None):
+        """
+        Sends payloads, one per request or REMOTE_SYNC_BATCH_SIZE per request
+        as a JSON array, and returns a (status code or None, latency ms) for
+        every payload. keys are the payloads' idempotency keys.
+        """
+        batch_size = get_setting('REMOTE_SYNC_BATCH_SIZE')
+
+        results = []
+        for start in range(0, len(payloads), batch_size):
+            batch = payloads[start:start + batch_size]
+            body = batch if batch_size > 1 else batch[0]
+            headers = {'Authorization': 'Token ' + token}
+            if keys:
+                headers['Idempotency-Key'] = batch_key(keys[start:start + batch_size])
+            started = time.perf_counter()
+            try:
+                response = self.session.post(self.base_url + ENTRIES_PATH, json=body, headers=headers,
+                                             timeout=get_setting('REMOTE_SYNC_TIMEOUT'))
+                status_code = response.status_code
+            except requests.RequestException:
+                logger.exception('Could not sync %d entries to %s', len(batch), self.base_url)
+                status_code = None
+            latency = (time.perf_counter() - started) * 1000
+            results.extend([(status_code, latency)] * len(batch))
+        return results
+
+
+def batch_key(keys):
+    if len(keys) == 1:
+        return keys[0]
+    return hashlib.sha256(':'.join(keys).encode('utf-8')).hexdigest()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url):
+    with _clients_lock:
+        if base_url not in _clients:
+            _clients[base_url] = SyncClient(base_url)
+        return _clients[base_url]
+
+
+def group_by_destination(envelopes):
+    groups = {}
+    for envelope in envelopes:
+        profile = getattr(envelope.author, 'profile', None)
+        if profile is None or not profile.token:
+            continue
+        if not profile.url:
+            logger.info('No URL. Did not save %s to TheCodeBlogs.com', str(envelope.id))
+            continue
+        groups.setdefault((profile.url, profile.token), []).append(envelope)
+    return groups
+
+
+def sync_envelopes(entry_envelope_ids, keys=None):
+    """
+    Posts envelopes to their authors' destinations, grouped per destination,
+    with at most REMOTE_SYNC_MAX_CONCURRENCY destinations in flight at once.
+
+    Returns {envelope id: (status code or None, latency ms)} for every
+    envelope that had somewhere to go. keys maps envelope ids to idempotency keys.
+    """
+    envelopes = list(EntryEnvelope.objects.filter(pk__in=entry_envelope_ids).select_related('author__profile'))
+    groups = group_by_destination(envelopes)
+    if not groups:
+        return {}
+
+    # Serialize here so the worker threads only do HTTP and never touch the database
+    payloads = {destination: list(EntrySerializer(group, many=True).data) for destination, group in groups.items()}
+
+    def send(destination):
+        url, token = destination
+        group_keys = [keys[envelope.pk] for envelope in groups[destination]] if keys else None
+        results = get_client(url).post_entries(token, payloads[destination], group_keys)
+        logger.info('Saved %d entries to %s', len(payloads[destination]), url)
+        return results
+
+    with ThreadPoolExecutor(max_workers=get_setting('REMOTE_SYNC_MAX_CONCURRENCY')) as pool:
+        futures = {destination: pool.submit(send, destination) for destination in payloads}
+
+    results = {}
+    for destination, future in futures.items():
+        for envelope, result in zip(groups[destination], future.result()):
+            results[envelope.pk] = result
+    return results
+
+
+def claim_outbox(entry_id=None):
+    """
+    Claims a batch of due SyncOutbox rows in a short transaction, oldest first.
+
+    Only the newest due row of each entry is claimed, the older ones are
+    marked superseded. Claimed rows are set to 'sending' with a lease of
+    REMOTE_SYNC_LEASE seconds, after which another drainer may take them over.
+    Entries that already have a row in flight are skipped, so each entry's
+    versions arrive in order.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        in_flight = SyncOutbox.objects.filter(status=SyncOutbox.SENDING, lease_expires_on__gte=now).values('entry_id')
+        due = SyncOutbox.objects.select_for_update(skip_locked=True).filter(
+            Q(status=SyncOutbox.PENDING, next_attempt_at__isnull=True) |
+            Q(status=SyncOutbox.PENDING, next_attempt_at__lte=now) |
+            Q(status=SyncOutbox.SENDING, lease_expires_on__lt=now)
+        ).exclude(entry_id__in=Subquery(in_flight))
+        if entry_id is not None:
+            due = due.filter(entry_id=entry_id)
+        rows = list(due.order_by('created_on', 'id')[:get_setting('REMOTE_SYNC_DRAIN_BATCH')])
+        if not rows:
+            return []
+
+        latest = {}
+        for row in rows:
+            latest[row.entry_id] = row
+        superseded = [row.pk for row in rows if latest[row.entry_id].pk != row.pk]
+        if superseded:
+            SyncOutbox.objects.filter(pk__in=superseded).update(status=SyncOutbox.SUPERSEDED)
+            stats.incr('outbox.superseded', len(superseded))
+
+        rows = list(latest.values())
+        lease_expires_on = now + timedelta(seconds=get_setting('REMOTE_SYNC_LEASE'))
+        SyncOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(
+            status=SyncOutbox.SENDING, lease_expires_on=lease_expires_on
+        )
+    return rows
+
+
+def retry_delay(attempts):
+    return min(get_setting('REMOTE_SYNC_RETRY_DELAY') * 2 ** (attempts - 1), get_setting('REMOTE_SYNC_RETRY_MAX_DELAY'))
+
+
+def drain_outbox(entry_id=None):
+    """
+    Delivers one batch of due SyncOutbox rows and returns (sent, failed).
+
+    The HTTP calls run outside any transaction, so saves that enqueue new
+    rows never wait on a remote. Failed rows go back to pending with an
+    exponential backoff until they have been tried REMOTE_SYNC_MAX_ATTEMPTS
+    times.
+    """
+    rows = claim_outbox(entry_id)
+    if not rows:
+        return 0, 0
+
+    results = sync_envelopes([row.envelope_id for row in rows],
+                             keys={row.envelope_id: row.idempotency_key for row in rows})
+
+    now = timezone.now()
+    sent = 0
+    failed = 0
+    for row in rows:
+        status_code, latency = results.get(row.envelope_id, (None, None))
+        row.attempts += 1
+        row.lease_expires_on = None
+        if status_code is not None and 200 <= status_code < 300:
+            row.status = SyncOutbox.SENT
+            row.sent_on = now
+            row.latency_ms = (now - row.created_on).total_seconds() * 1000
+            row.last_error = None
+            sent += 1
+            stats.incr('outbox.sent')
+            stats.incr('outbox.delivery_ms', row.latency_ms)
+            continue
+
+        failed += 1
+        if row.envelope_id not in results:
+            row.last_error = 'No destination'
+        else:
+            row.last_error = 'HTTP %s' % status_code if status_code else 'Connection error'
+        if row.attempts >= get_setting('REMOTE_SYNC_MAX_ATTEMPTS') or row.envelope_id not in results:
+            row.status = SyncOutbox.FAILED
+            stats.incr('outbox.failed')
+        else:
+            row.status = SyncOutbox.PENDING
+            row.next_attempt_at = now + timedelta(seconds=retry_delay(row.attempts))
+            stats.incr('outbox.retried')
+
+    with transaction.atomic():
+        SyncOutbox.objects.bulk_update(rows, ['status', 'attempts', 'sent_on', 'latency_ms', 'last_error',
+                                              'next_attempt_at', 'lease_expires_on'])
+    return sent, failed
+
+
+def schedule_outbox_retry(entry_id=None):
+    """
+    Queues another drain for when the earliest backed off row is due, at most
+    one per entry (or per full drain) at a time.
+    """
+    retries = SyncOutbox.objects.filter(status=SyncOutbox.PENDING, next_attempt_at__isnull=False)
+    if entry_id is not None:
+        retries = retries.filter(entry_id=entry_id)
+    due = retries.aggregate(due=Min('next_attempt_at'))['due']
+    if due is None:
+        return
+    countdown = max((due - timezone.now()).total_seconds(), 0)
+    if cache.shared().add(cache.make_key('outbox_retry', entry_id), 1, max(int(countdown), 1)):
+        drain_sync_outbox.apply_async(args=[entry_id], countdown=countdown)
+
+
+@app.task(name="drain_sync_outbox")
+def drain_sync_outbox(entry_id=None):
+    # Stops after a pass with failures and comes back when the backed off rows are due
+    while True:
+        sent, failed = drain_outbox(entry_id)
+        if not sent or failed:
+            break
+    if failed:
+        schedule_outbox_retry(entry_id)
@@ -0,0 +1,15 @@
+from rest_framework.renderers import JSONRenderer
+
+from blog.rendering import splice_raw
+
+
+class SplicingJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that copies pre-encoded entry fragments into the body instead
+    of decoding and re-encoding them.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return splice_raw(data, lambda plain: super(SplicingJSONRenderer, self).render(
+            plain, accepted_media_type, renderer_context
+        ))
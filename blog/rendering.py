@@ -0,0 +1,124 @@
+import json
+import re
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+
+EXCERPT_LENGTH = 280
+
+
+def iter_contents(entry):
+    for section in (entry or {}).get('sections') or []:
+        for content in (section or {}).get('contents') or []:
+            if content:
+                yield content
+
+
+def build_excerpt(entry, length=EXCERPT_LENGTH):
+    """
+    Plain text taken from the first non media content of an entry, truncated to length.
+    """
+    for content in iter_contents(entry):
+        value = content.get('value')
+        if content.get('type') == 'media' or not isinstance(value, str):
+            continue
+        text = ' '.join(strip_tags(value).split())
+        if text:
+            return Truncator(text).chars(length)
+    return ''
+
+
+RELATIVE_IMAGE_PREFIX = '<img src=/'
+
+
+def build_feed_description(entry):
+    """
+    The RSS item description for an entry, from its first content.
+
+    Relative media paths are stored root relative (RELATIVE_IMAGE_PREFIX) and
+    get the site's domain put in front when the feed is rendered.
+    """
+    try:
+        content = entry.get('sections')[0].get('contents')[0]
+        value = content.get('value')
+        if content.get('type') == 'media':
+            if 'http' in value:
+                return '<img src=' + value + '>'
+            return RELATIVE_IMAGE_PREFIX + value + '>'
+        return '<p>' + value + '</p>'
+    except:
+        return ''
+
+
+def entry_representation(instance):
+    """
+    The public representation of an EntryEnvelope, without the live view count.
+    """
+    return {
+        'id': instance.entry.get('id'),
+        'title': instance.entry.get('title'),
+        'sections': instance.entry.get('sections'),
+        'create_date': instance.entry.get('create_date'),
+        'edit_date': instance.entry.get('edit_date'),
+        'slug': instance.entry.get('slug'),
+        'published': instance.entry.get('published'),
+        'publish_date': instance.entry.get('publish_date'),
+        'should_publish_in_future': instance.entry.get('should_publish_in_future'),
+        'future_publish_date': instance.entry.get('future_publish_date'),
+        'version': instance.entry.get('version'),
+        'tags': instance.entry.get('tags'),
+        '__server_generated_properties': {
+            'author_id': instance.author_id,
+        }
+    }
+
+
+def render_entry(instance):
+    return json.dumps(
+        entry_representation(instance), cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')
+    ).encode('utf-8')
+
+
+class RawJSON(object):
+    """
+    Already encoded JSON that SplicingJSONRenderer copies into the response as is.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __reduce__(self):
+        return (RawJSON, (self.value,))
+
+
+def with_views(rendered, view_count):
+    # rendered is always a JSON object, so the counter goes in before its closing brace
+    return RawJSON(bytes(rendered)[:-1] + (',"views":%d}' % view_count).encode('utf-8'))
+
+
+def replace_raw(data, fragments, marker):
+    if isinstance(data, RawJSON):
+        fragments.append(data.value)
+        return '%s%d' % (marker, len(fragments) - 1)
+    if isinstance(data, dict):
+        return data.__class__((key, replace_raw(value, fragments, marker)) for key, value in data.items())
+    if isinstance(data, list):
+        return [replace_raw(value, fragments, marker) for value in data]
+    return data
+
+
+def splice_raw(data, encode):
+    """
+    Encodes data with encode(), copying any RawJSON fragments in verbatim.
+    """
+    fragments = []
+    marker = '__tcb_raw_%s_' % uuid.uuid4().hex
+    encoded = encode(replace_raw(data, fragments, marker))
+    if not fragments:
+        return encoded
+    placeholder = re.compile(('"%s(\\d+)"' % marker).encode('utf-8'))
+    return placeholder.sub(lambda match: bytes(fragments[int(match.group(1))]), encoded)
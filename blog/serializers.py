@@ -1,9 +1,19 @@
 from typing import Any
 
 from django.contrib.auth.models import User
+from django.db import models, transaction
 from rest_framework import serializers
 
-from blog.models import ( Comment, EntryEnvelope, Tag, View, Interaction, VisitorProfile )
+from blog.models import ( Comment, EntryEnvelope, Tag, View, Interaction, VisitorProfile, get_view_counts )
+from blog.rendering import entry_representation, with_views
+
+
+class EntryListSerializer(serializers.ListSerializer):
+    def to_representation(self, data: Any) -> Any:
+        # Count views for the whole page at once rather than once per entry
+        iterable = list(data.all() if isinstance(data, models.Manager) else data)
+        self.child.view_counts = get_view_counts([item.entry_id for item in iterable])
+        return super().to_representation(iterable)
 
 
 class EntrySerializer(serializers.BaseSerializer):
@@ -15,26 +25,21 @@ class EntrySerializer(serializers.BaseSerializer):
     edit_date = serializers.SerializerMethodField()
     slug = serializers.SerializerMethodField()
 
+    class Meta:
+        list_serializer_class = EntryListSerializer
+
     def to_representation(self, instance: Any) -> Any:
-        view_count = View.objects.filter(entry_id=instance.entry.get('id')).count()
-        return {
-            'id': instance.entry.get('id'),
-            'title': instance.entry.get('title'),
-            'sections': instance.entry.get('sections'),
-            'create_date': instance.entry.get('create_date'),
-            'edit_date': instance.entry.get('edit_date'),
-            'slug': instance.entry.get('slug'),
-            'published': instance.entry.get('published'),
-            'publish_date': instance.entry.get('publish_date'),
-            'should_publish_in_future': instance.entry.get('should_publish_in_future'),
-            'future_publish_date': instance.entry.get('future_publish_date'),
-            'version': instance.entry.get('version'),
-            'tags': instance.entry.get('tags'),
-            'views': view_count,
-            '__server_generated_properties': {
-                'author_id': instance.author.id,
-            }
-        }
+        view_counts = getattr(self, 'view_counts', None)
+        if view_counts is None:
+            view_counts = get_view_counts([instance.entry_id])
+        view_count = view_counts.get(str(instance.entry_id), 0)
+
+        if self.context.get('splice') and instance.rendered:
+            return with_views(instance.rendered, view_count)
+
+        representation = entry_representation(instance)
+        representation['views'] = view_count
+        return representation
 
     def to_internal_value(self, data: Any) -> Any:
         id = data.get('id')
@@ -68,15 +73,59 @@ class EntrySerializer(serializers.BaseSerializer):
     def update(self, instance: Any, validated_data: Any) -> Any:
         entry = validated_data
         author = self.context.get('request').user
-        ee = EntryEnvelope.objects.filter(entry_id=validated_data['id']).order_by('-version')[0]
-        ee.entry = entry
-        ee.save()
+        # Atomic so the save pipeline's outbox row commits with the envelope
+        with transaction.atomic():
+            ee = EntryEnvelope.objects.filter(entry_id=validated_data['id']).order_by('-version')[0]
+            ee.entry = entry
+            ee.save()
         return ee
 
     def create(self, validated_data: Any) -> Any:
         entry = validated_data
         author = self.context.get('request').user
-        return EntryEnvelope.objects.create(entry=entry, author=author)
+        with transaction.atomic():
+            return EntryEnvelope.objects.create(entry=entry, author=author)
+
+
+class EntrySummarySerializer(serializers.BaseSerializer):
+    """
+    List representation built from the denormalized EntryEnvelope columns, so
+    the entry JSON never has to be loaded. Use with a queryset that defers
+    'entry', prefetches 'tags' and adds with_stored_dates().
+    """
+
+    class Meta:
+        list_serializer_class = EntryListSerializer
+
+    def stored_date(self, instance: Any, key: str) -> Any:
+        # Exactly as stored in the entry JSON, like the full representation
+        if instance.entry_delta is None:
+            return getattr(instance, 'stored_' + key)
+        for operation in reversed(instance.entry_delta):
+            if operation['path'] == '/' + key:
+                return operation.get('value')
+        return getattr(instance, 'base_' + key)
+
+    def to_representation(self, instance: Any) -> Any:
+        view_counts = getattr(self, 'view_counts', None)
+        if view_counts is None:
+            view_counts = get_view_counts([instance.entry_id])
+        return {
+            'id': str(instance.entry_id) if instance.entry_id else None,
+            'title': instance.title,
+            'excerpt': instance.excerpt,
+            'create_date': self.stored_date(instance, 'create_date'),
+            'edit_date': self.stored_date(instance, 'edit_date'),
+            'slug': instance.slug,
+            'published': instance.published,
+            'publish_date': self.stored_date(instance, 'publish_date'),
+            'version': instance.version,
+            'tags': [tag.label for tag in instance.tags.all()],
+            'views': view_counts.get(str(instance.entry_id), 0),
+            '__server_generated_properties': {
+                'author_id': instance.author_id,
+            }
+        }
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -118,6 +167,7 @@ class CommentSerializer(serializers.ModelSerializer):
 
 class SyncConfigSerializer(serializers.Serializer):
     entries_endpoint = serializers.CharField()
+    changes_endpoint = serializers.CharField()
     images_endpoint = serializers.CharField()
 
 
@@ -4,9 +4,7 @@ from django.dispatch import receiver
 from django.db.models.signals import post_save
 
 from blog.models import EntryEnvelope
-from blog.serializers import EntrySerializer
-
-from blog.tasks import sync_to_the_code_blogs
+from blog.pipeline import run_post_save_pipeline
 
 
 logging.basicConfig(level=logging.INFO)
@@ -15,6 +13,4 @@ logger = logging.getLogger(__name__)
 
 @receiver(post_save, sender=EntryEnvelope)
 def entry_post_save(sender, instance, *args, **kwargs):
-    if instance.published:
-        if instance.author.profile.token:
-            sync_to_the_code_blogs.delay(str(instance.id))
+    run_post_save_pipeline(instance)
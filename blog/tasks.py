@@ -1,65 +1,175 @@
 import logging
-import requests
-import datetime
-import pytz
+from datetime import timedelta
 
 from backend.celery import app
-from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+from django.utils import timezone
 
-from blog.models import EntryEnvelope
-from blog.serializers import EntrySerializer
+from blog import stats
+from blog.conf import get_setting
+from blog.models import (ArchivedEntryEnvelope, Comment, EntryEnvelope, EntryHead, SyncOutbox, View,
+                         compress_entry)
+from blog.pipeline import run_post_save_pipeline
+from blog.remote_sync import sync_envelopes
 
 
-utc = pytz.UTC
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-@app.task(name="publish_entries_if_scheduled")
-def publish_entries_if_scheduled():
-    now = utc.localize(datetime.datetime.now())
-    published_list = []
-    entries = EntryEnvelope.objects.filter(future_publish_date__isnull=False, should_publish_in_future=True,
-                                           defunct=False).order_by('-edit_date', 'entry_id')
-    for entry in entries:
-        if entry.entry_id in published_list:
-            logger.info('An entry for the id %s has already been published', str(entry.entry_id))
-            entry.should_publish_in_future = False
-            entry.defunct = True
-            entry.published = False
+PUBLISHED_FIELDS = ['entry', 'published', 'publish_date', 'should_publish_in_future', 'future_publish_processed_on',
+                    'defunct', 'rendered', 'excerpt', 'feed_description', 'entry_delta', 'delta_base']
+
+
+def publish_due_entries(entry_id=None):
+    """
+    Publishes every scheduled envelope whose time has come, set based.
+
+    For each entry only the most recently edited due version is published,
+    the other due versions are retired. Rows are locked with SKIP LOCKED so
+    the poller and ETA tasks never publish the same row twice.
+    """
+    now = timezone.now()
+    due = EntryEnvelope.objects.filter(should_publish_in_future=True, defunct=False, future_publish_date__lte=now)
+    if entry_id is not None:
+        due = due.filter(entry_id=entry_id)
+    winner_ids = due.order_by('entry_id', F('edit_date').desc(nulls_last=True)).distinct('entry_id').values('pk')
+
+    with transaction.atomic():
+        winners = list(EntryEnvelope.objects.select_for_update(skip_locked=True).filter(pk__in=Subquery(winner_ids)))
+        losers = list(due.select_for_update(skip_locked=True).exclude(pk__in=[winner.pk for winner in winners])
+                      .filter(entry_id__in=[winner.entry_id for winner in winners]))
+
+        for entry in winners:
+            entry.entry['should_publish_in_future'] = False
+            entry.entry['published'] = True
+            entry.entry['publish_date'] = now.isoformat()
+            entry.populate_stuff()
+            compress_entry(entry, delta=False)
+            entry.future_publish_processed_on = now
 
+        for entry in losers:
+            logger.info('An entry for the id %s has already been published', str(entry.entry_id))
             entry.entry['should_publish_in_future'] = False
             entry.entry['published'] = False
-            entry.save()
-        else:
-            if entry.future_publish_date < now:
-                entry.should_publish_in_future = False
-                entry.published = True
-                entry.publish_date = now
-                entry.future_publish_processed_on = now
+            entry.populate_stuff()
+            compress_entry(entry, delta=False)
+            entry.defunct = True
 
-                entry.entry['should_publish_in_future'] = False
-                entry.entry['published'] = True
-                entry.entry['publish_date'] = now.isoformat()
+        EntryEnvelope.objects.bulk_update(winners + losers, PUBLISHED_FIELDS)
 
-                entry.save()
+        # bulk_update skips post_save, run what it would have run
+        for entry in winners:
+            run_post_save_pipeline(entry, skip=('tags',))
 
+    stats.incr('publish.scheduled', len(winners))
+    return len(winners)
 
-@app.task(name="sync_to_the_code_blogs")
-def sync_to_the_code_blogs(entry_envelope_id):
-    ee = EntryEnvelope.objects.get(pk=entry_envelope_id)
-    token = ee.author.profile.token
-    data = EntrySerializer(instance=ee)
 
-    serializer = EntrySerializer(ee)
+@app.task(name="publish_entries_if_scheduled")
+def publish_entries_if_scheduled():
+    publish_due_entries()
 
-    if ee.author.profile.url:
-        headers = {'Authorization': 'Token ' + token}
-        r = requests.post(ee.author.profile.url + '/api/entries/', json=serializer.data, headers=headers)
 
-        logger.info('Saved %s to TheCodeBlogs.com', str(ee.id))
-    else:
-        logger.info('No URL. Did not save %s to TheCodeBlogs.com', str(ee.id))
+@app.task(name="publish_scheduled_entry")
+def publish_scheduled_entry(entry_id):
+    publish_due_entries(entry_id)
 
 
+@app.task(name="sync_to_the_code_blogs")
+def sync_to_the_code_blogs(entry_envelope_id):
+    sync_envelopes([entry_envelope_id])
+
+
+@app.task(name="sync_many_to_the_code_blogs")
+def sync_many_to_the_code_blogs(entry_envelope_ids):
+    sync_envelopes(entry_envelope_ids)
+
+
+def archivable_versions(now=None):
+    """
+    Retired versions past the retention policy: older than the newest
+    ARCHIVE_KEEP_VERSIONS versions of their entry and created more than
+    ARCHIVE_KEEP_DAYS days ago. Versions that are still an entry's head,
+    a delta snapshot, or have comments, views or a pending sync are kept.
+    """
+    now = now or timezone.now()
+    keep = max(get_setting('ARCHIVE_KEEP_VERSIONS'), 1)
+    oldest_kept = EntryEnvelope.objects.filter(entry_id=OuterRef('entry_id')).order_by(
+        F('version').desc(nulls_last=True)
+    ).values('version')[keep - 1:keep]
+    return EntryEnvelope.objects.filter(
+        defunct=True,
+        published=False,
+        should_publish_in_future=False,
+        created_on__lt=now - timedelta(days=get_setting('ARCHIVE_KEEP_DAYS')),
+        version__lt=Subquery(oldest_kept),
+    ).filter(
+        ~Exists(EntryHead.objects.filter(Q(envelope=OuterRef('pk')) | Q(published_envelope=OuterRef('pk')))),
+        ~Exists(EntryEnvelope.objects.filter(delta_base=OuterRef('pk'))),
+        ~Exists(Comment.objects.filter(entry_envelope=OuterRef('pk'))),
+        ~Exists(View.objects.filter(entry_envelope=OuterRef('pk'))),
+        ~Exists(SyncOutbox.objects.filter(envelope=OuterRef('pk'), status__in=(SyncOutbox.PENDING, SyncOutbox.SENDING))),
+    )
+
+
+def archive_versions(batch_size):
+    """
+    Moves one batch of archivable versions to ArchivedEntryEnvelope in a
+    short transaction. Returns how many were archived.
+    """
+    with transaction.atomic():
+        ids = list(archivable_versions().select_for_update(skip_locked=True).order_by('created_on')
+                   .values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        # Check again now that the rows are locked. Comments, views and heads take a key share lock on
+        # the envelope when their FK is checked, so no new reference can commit until this transaction does.
+        locked = len(ids)
+        ids = list(archivable_versions().filter(pk__in=ids).values_list('pk', flat=True))
+        if len(ids) < locked:
+            logger.info('Kept %d versions referenced since they were selected for archiving', locked - len(ids))
+        if not ids:
+            return 0
+
+        envelopes = EntryEnvelope.objects.filter(pk__in=ids).select_related('delta_base')
+        ArchivedEntryEnvelope.objects.bulk_create([
+            ArchivedEntryEnvelope(
+                id=envelope.pk,
+                entry_id=envelope.entry_id,
+                author_id=envelope.author_id,
+                entry=envelope.entry,
+                title=envelope.title,
+                slug=envelope.slug,
+                version=envelope.version,
+                published=envelope.published,
+                publish_date=envelope.publish_date,
+                create_date=envelope.create_date,
+                edit_date=envelope.edit_date,
+                created_on=envelope.created_on,
+            ) for envelope in envelopes
+        ], ignore_conflicts=True)
+
+        EntryEnvelope.tags.through.objects.filter(entryenvelope_id__in=ids).delete()
+        SyncOutbox.objects.filter(envelope_id__in=ids).delete()
+        # A plain DELETE without the collector: the check above proved nothing references these rows,
+        # so there is nothing to cascade, and none of them are heads, so the post_delete head refresh has
+        # nothing to do. A reference inserted meanwhile fails its FK check at commit rather than being
+        # silently cascaded away.
+        EntryEnvelope.objects.filter(pk__in=ids)._raw_delete(EntryEnvelope.objects.db)
+
+    stats.incr('archive.versions', len(ids))
+    return len(ids)
+
+
+@app.task(name="archive_defunct_versions")
+def archive_defunct_versions():
+    archived = 0
+    for batch in range(get_setting('ARCHIVE_MAX_BATCHES')):
+        count = archive_versions(get_setting('ARCHIVE_BATCH_SIZE'))
+        archived += count
+        if count < get_setting('ARCHIVE_BATCH_SIZE'):
+            break
+    logger.info('Archived %d retired versions', archived)
+    return archived
@@ -0,0 +1,200 @@
+import threading
+import uuid
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from blog import ingest
+from blog.changes import changes_since
+from blog.conf import DEFAULTS
+from blog.models import EntryEnvelope, EntryHead, View, refresh_entry_head
+
+
+def delta_settings(setting):
+    return {'VERSION_STORAGE': 'delta', 'SNAPSHOT_INTERVAL': 10}.get(setting, DEFAULTS.get(setting))
+
+
+def unsettled_settings(setting):
+    return {'SYNC_SETTLE_SECONDS': 0}.get(setting, DEFAULTS.get(setting))
+
+
+class DeltaStorageTests(TestCase):
+
+    def setUp(self):
+        # Started here rather than as a class decorator, which would skip setUp
+        patcher = mock.patch('blog.models.get_setting', delta_settings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.author = User.objects.create(username='delta-author')
+        self.entry_id = str(uuid.uuid4())
+        self.entries = {}
+        for version in range(1, 5):
+            entry = {
+                'id': self.entry_id,
+                'title': 'Version %d' % version,
+                'slug': 'delta-entry',
+                'version': version,
+                'published': False,
+                'should_publish_in_future': False,
+                'tags': [],
+                'sections': [{'contents': [{'content': 'Paragraph %d' % i}]} for i in range(version)],
+            }
+            envelope = EntryEnvelope.objects.create(author=self.author, entry=entry)
+            self.entries[envelope.pk] = entry
+
+    def stored(self):
+        return {pk: (entry, delta) for pk, entry, delta in
+                EntryEnvelope.objects.filter(entry_id=self.entry_id).values_list('pk', 'entry', 'entry_delta')}
+
+    def assertHistoryIntact(self):
+        for envelope in EntryEnvelope.objects.filter(entry_id=self.entry_id):
+            self.assertEqual(envelope.entry, self.entries[envelope.pk])
+
+    def test_delta_rows_read_back_the_full_entry(self):
+        stored = self.stored()
+        self.assertEqual(sum(1 for entry, delta in stored.values() if entry is None and delta is not None), 3)
+        self.assertHistoryIntact()
+        deferred = EntryEnvelope.objects.filter(entry_id=self.entry_id, delta_base__isnull=False).defer('entry')
+        for envelope in deferred:
+            self.assertEqual(envelope.entry, self.entries[envelope.pk])
+
+    def test_deleting_a_snapshot_keeps_its_deltas(self):
+        snapshot = EntryEnvelope.objects.get(entry_id=self.entry_id, version=1)
+        del self.entries[snapshot.pk]
+        snapshot.delete()
+
+        for entry, delta in self.stored().values():
+            self.assertIsNotNone(entry)
+            self.assertIsNone(delta)
+        self.assertHistoryIntact()
+
+    def test_compacting_twice_keeps_history(self):
+        for interval in (2, 2, 1):
+            call_command('compact_entry_versions', interval=interval, samples=1, stdout=StringIO())
+            self.assertHistoryIntact()
+        self.assertTrue(all(delta is None for entry, delta in self.stored().values()))
+
+
+@mock.patch('blog.changes.get_setting', unsettled_settings)
+class EntryHeadTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create(username='head-author')
+        self.entry_id = str(uuid.uuid4())
+        self.envelope = self.save_version(1, published=True)
+
+    def save_version(self, version, published):
+        # The post_save pipeline refreshes the head
+        return EntryEnvelope.objects.create(author=self.author, entry={
+            'id': self.entry_id,
+            'title': 'Version %d' % version,
+            'slug': 'head-entry-%d' % version,
+            'version': version,
+            'published': published,
+            'should_publish_in_future': False,
+            'tags': [],
+            'sections': [],
+        })
+
+    def head(self):
+        return EntryHead.objects.get(entry_id=self.entry_id)
+
+    def test_saving_a_draft_keeps_the_live_version(self):
+        draft = self.save_version(2, published=False)
+
+        head = self.head()
+        self.assertEqual(head.envelope_id, draft.pk)
+        self.assertEqual(head.slug, 'head-entry-2')
+        self.assertEqual(head.published_envelope_id, self.envelope.pk)
+        self.assertEqual(head.published_slug, 'head-entry-1')
+        self.assertTrue(head.published)
+
+    def test_publishing_moves_the_live_version(self):
+        previous = self.head().modified_on
+        published = self.save_version(2, published=True)
+
+        head = self.head()
+        self.assertEqual(head.envelope_id, published.pk)
+        self.assertEqual(head.published_envelope_id, published.pk)
+        self.assertEqual(head.published_slug, 'head-entry-2')
+        self.assertGreater(head.modified_on, previous)
+
+    def test_refreshing_an_unchanged_entry_keeps_the_head(self):
+        head = refresh_entry_head(self.entry_id)
+        self.assertEqual(head.pk, self.head().pk)
+        self.assertEqual(head.published_envelope_id, self.envelope.pk)
+
+    def test_deleting_every_version_leaves_a_tombstone(self):
+        heads, has_more, token = changes_since(None, 10)
+        self.assertEqual([(str(head.entry_id), head.published) for head in heads], [(self.entry_id, True)])
+        position = (heads[-1].modified_on, heads[-1].id)
+
+        self.envelope.delete()
+
+        head = self.head()
+        self.assertIsNone(head.envelope_id)
+        self.assertIsNone(head.published_envelope_id)
+        heads, has_more, token = changes_since(position, 10)
+        self.assertEqual([(str(head.entry_id), head.published) for head in heads], [(self.entry_id, False)])
+
+
+class ViewDeduplicationTests(TransactionTestCase):
+    threads = 8
+
+    def setUp(self):
+        self.author = User.objects.create(username='view-author')
+        entry_id = str(uuid.uuid4())
+        self.envelope = EntryEnvelope.objects.create(author=self.author, entry={
+            'id': entry_id,
+            'title': 'Viewed entry',
+            'slug': 'viewed-entry',
+            'version': 1,
+            'published': True,
+            'should_publish_in_future': False,
+            'tags': [],
+            'sections': [],
+        })
+
+    def record_concurrently(self, record, make_view):
+        # Every thread sends the same view at the same moment, on its own connection
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def run():
+            try:
+                barrier.wait()
+                record([make_view()])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def assertRecordedOnce(self, views):
+        self.assertEqual(views.count(), 1)
+        head = EntryHead.objects.get(entry_id=self.envelope.entry_id)
+        self.assertEqual(head.view_count, 1)
+
+    def test_concurrent_session_views_are_recorded_once(self):
+        session_uid = uuid.uuid4()
+        self.record_concurrently(ingest.record_views, lambda: View(
+            entry_envelope=self.envelope, entry_id=self.envelope.entry_id, session_uid=session_uid
+        ))
+        self.assertRecordedOnce(View.objects.filter(entry_envelope=self.envelope, session_uid=session_uid))
+
+    def test_concurrent_user_views_are_recorded_once(self):
+        viewer = User.objects.create(username='viewer')
+        self.record_concurrently(ingest.insert_views, lambda: View(
+            entry_envelope=self.envelope, entry_id=self.envelope.entry_id, user=viewer
+        ))
+        self.assertRecordedOnce(View.objects.filter(entry_envelope=self.envelope, user=viewer))
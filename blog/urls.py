@@ -2,7 +2,8 @@ from django.urls import path
 from rest_framework.routers import DefaultRouter
 
 from blog.views import ( EntryViewSet, ListUser, CommentViewSet, SyncConfig, TagViewSet, ViewViewSet,
-                        InteractionViewSet, VisitorProfileViewSet, EntriesFeed, AdminEntryViewSet, AdminCommentViewSet )
+                        InteractionViewSet, VisitorProfileViewSet, EntriesFeed, AdminEntryViewSet, AdminCommentViewSet,
+                        Stats )
 
 router = DefaultRouter()
 
@@ -21,4 +22,5 @@ urlpatterns = [
     path('me/', ListUser.as_view()),
     path('sync_config/', SyncConfig.as_view()),
     path('rss/', EntriesFeed()),
+    path('stats/', Stats.as_view()),
 ] + router.urls
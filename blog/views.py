@@ -1,25 +1,40 @@
 import json
 import uuid
+from datetime import timedelta
 from typing import Any
 from urllib.request import Request
 
 from django.conf import settings
 from django.contrib.auth.models import User, AnonymousUser
-from django.db.models import Q
+from django.db.models import Q, Count, Max
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.syndication.views import Feed, add_domain
 from django.contrib.sites.shortcuts import get_current_site
+from django.core import signing
+from django.http import HttpResponse
 
 from rest_framework import viewsets, generics, status, mixins
 from rest_framework.exceptions import PermissionDenied
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.decorators import action
-
-from blog.models import EntryEnvelope, Comment, Tag, View, Interaction, VisitorProfile
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from blog import cache, ingest, stats
+from blog.conf import get_setting, USE_DEFAULTS
+from blog.changes import read_token, changes_since
+from blog.conditional import make_etag, conditional_response
+from blog.hll import HyperLogLog, RELATIVE_ERROR
+from blog.models import (EntryEnvelope, EntryHead, Comment, Tag, View, Interaction, VisitorProfile,
+                         get_unique_visitor_sketches)
+from blog.pagination import EntryPagination, CommentPagination
+from blog.renderers import SplicingJSONRenderer
+from blog.rendering import RELATIVE_IMAGE_PREFIX
 from blog.permissions import IsOwnerOrReadOnly, ReadOnly, CanPostButNotRead, CanApprove
-from blog.serializers import ( EntrySerializer, UserSerializer, CommentSerializer, SyncConfigSerializer, TagSerializer,
+from blog.serializers import ( EntrySerializer, EntrySummarySerializer, UserSerializer, CommentSerializer, SyncConfigSerializer, TagSerializer,
                               ViewSerializer, InteractionSerializer, VisitorProfileSerializer)
 
 
@@ -39,45 +54,189 @@ def get_entry_from_params(params):
     return entry[0]
 
 
-class EntryViewSet(viewsets.ModelViewSet):
+class EntrySummaryMixin(object):
+    """
+    Serves the light summary representation from the summary route or ?view=summary.
+    """
+
+    def wants_summary(self):
+        return self.action == 'summary' or (
+            self.action == 'list' and self.request.query_params.get('view') == 'summary'
+        )
+
+    def get_serializer_class(self):
+        if self.wants_summary():
+            return EntrySummarySerializer
+        return super().get_serializer_class()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.wants_summary():
+            return queryset.defer('entry').prefetch_related('tags').with_stored_dates()
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        return self.list(request)
+
+
+class PreRenderedEntryMixin(object):
+    """
+    Builds JSON responses from the envelopes' pre-encoded representations.
+    """
+    renderer_classes = [SplicingJSONRenderer] + [
+        renderer for renderer in api_settings.DEFAULT_RENDERER_CLASSES if renderer is not JSONRenderer
+    ]
+
+    def splicing(self):
+        return isinstance(getattr(self.request, 'accepted_renderer', None), SplicingJSONRenderer)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['splice'] = self.splicing()
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.splicing() and self.get_serializer_class() is EntrySerializer:
+            # Rows rendered before the backfill still load the entry lazily
+            return queryset.defer('entry')
+        if get_setting('VERSION_STORAGE') == 'delta' and self.get_serializer_class() is EntrySerializer:
+            # Delta versions are patched onto their snapshot, load it in the same query
+            return queryset.select_related('delta_base')
+        return queryset
+
+
+class EntryViewSet(PreRenderedEntryMixin, EntrySummaryMixin, viewsets.ModelViewSet):
     serializer_class = EntrySerializer
     permission_classes = [ReadOnly]
+    pagination_class = EntryPagination
     lookup_field = 'entry_id'
     filter_backends = [DjangoFilterBackend]
     filter_fields = ('title', 'tags__label')
 
     def get_queryset(self):
-        return EntryEnvelope.objects.only_published().order_by('-create_date', 'entry_id',
-                                                                     '-version').distinct('create_date', 'entry_id')
+        return EntryEnvelope.objects.published_heads()
+
+    def list(self, request, *args, **kwargs):
+        # View counts are part of the body, so they are part of the etag too
+        modified_on, live, views = EntryHead.objects.watermark(views=True)
+        return conditional_response(
+            request, make_etag('entries', modified_on, live, views, request.get_full_path()), modified_on,
+            lambda: cache.cached_response(
+                'list', request.get_full_path(),
+                lambda: super(EntryViewSet, self).list(request, *args, **kwargs),
+                generational=True
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            entry_id = str(uuid.UUID(str(kwargs[self.lookup_field])))
+        except ValueError:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        build = lambda: cache.cached_response(
+            'entry', entry_id,
+            lambda: super(EntryViewSet, self).retrieve(request, *args, **kwargs)
+        )
+        return self.conditional_entry_response(request, EntryHead.objects.filter(entry_id=entry_id), build)
 
     @action(detail=True, methods=['get'])
     def by_slug(self, request, entry_id):
-        envelopes = EntryEnvelope.objects.only_published().filter(slug=entry_id).order_by('-create_date', 'entry_id',
-                                                                         '-version').distinct('create_date', 'entry_id')
-        if envelopes.count() > 0:
-            serializer = self.get_serializer(instance=envelopes[0])
+        build = lambda: cache.cached_response('slug', entry_id, lambda: self.get_by_slug(entry_id))
+        return self.conditional_entry_response(request, EntryHead.objects.filter(published_slug=entry_id), build)
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    def unique_visitors(self, request, entry_id):
+        try:
+            entry_id = str(uuid.UUID(entry_id))
+        except ValueError:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        try:
+            day = parse_date(request.query_params['date']) if 'date' in request.query_params else timezone.now().date()
+        except ValueError:
+            day = None
+        if day is None:
+            return Response({'date': ['Expected YYYY-MM-DD']}, status=status.HTTP_400_BAD_REQUEST)
+        week_start = day - timedelta(days=6)
+        sketches = get_unique_visitor_sketches(entry_id, week_start, day)
+        week = HyperLogLog()
+        for sketch in sketches.values():
+            week.merge(sketch)
+        return Response({
+            'entry_id': entry_id,
+            'date': day.isoformat(),
+            'day': sketches.get(day, HyperLogLog()).count(),
+            'week_start': week_start.isoformat(),
+            'week': week.count(),
+            'relative_error': RELATIVE_ERROR,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        since = request.query_params.get('since')
+        try:
+            position = read_token(since) if since else None
+        except (signing.BadSignature, ValueError):
+            return Response({'since': ['Invalid token']}, status=status.HTTP_400_BAD_REQUEST)
+
+        heads, has_more, token = changes_since(position, get_setting('SYNC_PAGE_SIZE'))
+
+        live_ids = [head.published_envelope_id for head in heads if head.published]
+        envelopes = EntryEnvelope.objects.filter(pk__in=live_ids)
+        if self.splicing():
+            envelopes = envelopes.defer('entry')
+        elif get_setting('VERSION_STORAGE') == 'delta':
+            envelopes = envelopes.select_related('delta_base')
+        envelopes = {envelope.pk: envelope for envelope in envelopes}
+        serializer = self.get_serializer([envelopes[pk] for pk in live_ids if pk in envelopes], many=True)
+
+        # A full sync has nothing to delete yet
+        deleted = [str(head.entry_id) for head in heads if not head.published] if position else []
+
+        return Response({
+            'token': token,
+            'has_more': has_more,
+            'entries': serializer.data,
+            'deleted': deleted,
+        }, status=status.HTTP_200_OK)
+
+    def conditional_entry_response(self, request, heads, build):
+        head = heads.filter(published=True).order_by('-create_date', 'entry_id').values_list(
+            'published_envelope_id', 'published_envelope__version', 'modified_on', 'view_count'
+        ).first()
+        if head is None:
+            return build()
+        envelope_id, version, modified_on, view_count = head
+        return conditional_response(
+            request, make_etag('entry', envelope_id, version, modified_on, view_count), modified_on, build
+        )
+
+    def get_by_slug(self, slug):
+        envelope = EntryEnvelope.objects.published_heads().filter(slug=slug).first()
+        if envelope is not None:
+            serializer = self.get_serializer(instance=envelope)
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
 
-class AdminEntryViewSet(viewsets.ModelViewSet):
+class AdminEntryViewSet(PreRenderedEntryMixin, EntrySummaryMixin, viewsets.ModelViewSet):
     serializer_class = EntrySerializer
     permission_classes = [IsOwnerOrReadOnly]
+    pagination_class = EntryPagination
     lookup_field = 'entry_id'
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['title', 'published', 'defunct']
 
     def get_queryset(self):
-        return EntryEnvelope.objects.order_by('-create_date', 'entry_id',
-                                                                     '-version').distinct('create_date', 'entry_id')
+        return EntryEnvelope.objects.heads()
 
     @action(detail=True, methods=['get'])
     def by_slug(self, request, entry_id):
-        envelopes = EntryEnvelope.objects.filter(slug=entry_id).order_by('-create_date', 'entry_id',
-                                                                         '-version').distinct('create_date', 'entry_id')
-        if envelopes.count() > 0:
-            serializer = self.get_serializer(instance=envelopes[0])
+        envelope = EntryEnvelope.objects.heads().filter(slug=entry_id).first()
+        if envelope is not None:
+            serializer = self.get_serializer(instance=envelope)
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
             return Response(status=status.HTTP_404_NOT_FOUND)
@@ -86,6 +245,7 @@ class AdminEntryViewSet(viewsets.ModelViewSet):
 class CommentViewSet(viewsets.ModelViewSet):
     serializer_class = CommentSerializer
     permission_classes = [IsOwnerOrReadOnly]
+    pagination_class = CommentPagination
 
     def get_queryset(self):
         try:
@@ -123,6 +283,7 @@ class CommentViewSet(viewsets.ModelViewSet):
 class AdminCommentViewSet(viewsets.ModelViewSet):
     serializer_class = CommentSerializer
     permission_classes = [CanApprove]
+    pagination_class = CommentPagination
 
     def get_queryset(self):
         try:
@@ -159,12 +320,20 @@ class ListUser(generics.ListAPIView):
         return self.get_object(self.request.user.id)
 
 
+class Stats(generics.GenericAPIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(stats.snapshot(), status=status.HTTP_200_OK)
+
+
 class SyncConfig(generics.RetrieveAPIView):
     serializer_class = SyncConfigSerializer
     def get(self, request):
         return Response(
             {
                 'entries_endpoint': 'blog_api/entries/?published=true',
+                'changes_endpoint': 'blog_api/entries/changes/',
                 'images_endpoint': '',
             },
             status=status.HTTP_200_OK
@@ -178,52 +347,122 @@ class TagViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Tag.objects.all();
 
+    def list(self, request, *args, **kwargs):
+        # Tags only ever change through entry saves, which move the head watermark
+        modified_on, live = EntryHead.objects.watermark()
+        tags = Tag.objects.aggregate(count=Count('id'), last=Max('id'))
+        return conditional_response(
+            request, make_etag('tags', modified_on, live, tags['count'], tags['last'], request.get_full_path()),
+            modified_on,
+            lambda: super(TagViewSet, self).list(request, *args, **kwargs)
+        )
 
-class ViewViewSet(mixins.CreateModelMixin,
-                  viewsets.GenericViewSet):
-    serializer_class = ViewSerializer
-    permission_classes = [CanPostButNotRead]
-
-    def get_queryset(self):
-        return View.objects.all();
 
-    def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        e_id = serializer.initial_data['entry']
-        serializer.is_valid(raise_exception=True)
+class VisitorIdMixin(object):
+    """
+    Identifies anonymous visitors of the tracking endpoints.
 
-        ee = EntryEnvelope.objects.filter(entry_id=e_id)[0]
-        serializer.validated_data['entry_envelope'] = ee
-        serializer.validated_data['entry_id'] = ee.entry.get('id')
+    VISITOR_ID_MODE 'session' keeps the id in request.session. 'cookie' keeps
+    it in a long lived signed cookie that is checked in memory, so tracking
+    requests never write or create sessions.
+    """
+    visitor_id_salt = 'blog.visitor_id'
 
-        if request.user.is_anonymous:
+    def visitor_id(self, request):
+        if get_setting('VISITOR_ID_MODE') != 'cookie':
             sid_as_string = request.session.get('session_uid', None)
             if sid_as_string is None:
                 sid = uuid.uuid4()
                 request.session['session_uid'] = str(sid)
             else:
                 sid = uuid.UUID(sid_as_string)
+            return sid
+
+        value = request.get_signed_cookie(get_setting('VISITOR_ID_COOKIE_NAME'), default=None,
+                                          salt=self.visitor_id_salt, max_age=get_setting('VISITOR_ID_COOKIE_AGE'))
+        if value is not None:
+            try:
+                return uuid.UUID(value)
+            except ValueError:
+                pass
+
+        sid = None
+        # Visitors that already have a session keep its id, read once before the cookie is issued
+        if settings.SESSION_COOKIE_NAME in request.COOKIES:
+            try:
+                sid = uuid.UUID(request.session.get('session_uid', None))
+                stats.incr('visitor_id.adopted_from_session')
+            except (TypeError, ValueError):
+                pass
+        self.issued_visitor_id = sid or uuid.uuid4()
+        stats.incr('visitor_id.issued')
+        return self.issued_visitor_id
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        issued = getattr(self, 'issued_visitor_id', None)
+        if issued is not None:
+            response.set_signed_cookie(
+                get_setting('VISITOR_ID_COOKIE_NAME'), str(issued), salt=self.visitor_id_salt,
+                max_age=get_setting('VISITOR_ID_COOKIE_AGE'), secure=request.is_secure(), httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+
+class ViewViewSet(VisitorIdMixin,
+                  mixins.CreateModelMixin,
+                  viewsets.GenericViewSet):
+    serializer_class = ViewSerializer
+    permission_classes = [CanPostButNotRead]
+
+    def get_queryset(self):
+        return View.objects.all();
+
+    def resolve_entry(self, request):
+        """
+        (entry id, envelope id) the request's view is recorded against, or
+        (None, error response). Both ingest modes use the published version,
+        so switching between them doesn't count a visitor twice.
+        """
+        if not isinstance(request.data, dict):
+            return None, Response({'non_field_errors': ['Expected an object.']},
+                                  status=status.HTTP_400_BAD_REQUEST)
+        try:
+            entry_id = uuid.UUID(str(request.data.get('entry')))
+        except ValueError:
+            return None, Response({'entry': ['Must be a valid UUID.']}, status=status.HTTP_400_BAD_REQUEST)
+        envelope_id = ingest.view_envelope_id(entry_id)
+        if envelope_id is None:
+            return None, Response({'entry': ['No such entry.']}, status=status.HTTP_400_BAD_REQUEST)
+        return (entry_id, envelope_id), None
 
+    def create(self, request, *args, **kwargs):
+        resolved, error = self.resolve_entry(request)
+        if error is not None:
+            return error
+        entry_id, envelope_id = resolved
+
+        view = View(entry_envelope_id=envelope_id, entry_id=entry_id)
         if request.user.is_anonymous:
-            recorded_view = View.objects.filter(entry_envelope=ee, session_uid=sid)
+            view.session_uid = self.visitor_id(request)
         else:
-            recorded_view = View.objects.filter(entry_envelope=ee, user=request.user)
+            view.user = request.user
 
-        # Already recorded
-        if recorded_view.count() > 0:
-            return Response([], status=status.HTTP_200_OK)
-        else:
-            self.perform_create(serializer)
-            if request.user.is_anonymous:
-                serializer.instance.session_uid = sid
-            else:
-                serializer.instance.user = request.user
+        if get_setting('VIEW_INGEST_MODE') == 'buffered':
+            # The write and dedup happen in the flusher
+            ingest.buffer_view(view)
+            return Response([], status=status.HTTP_202_ACCEPTED)
 
-            serializer.instance.save()
-            headers = self.get_success_headers(serializer.data)
-            return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        # Already recorded, the unique constraints skipped the insert
+        if not ingest.insert_views([view]):
+            return Response([], status=status.HTTP_200_OK)
+        serializer = self.get_serializer(instance=view)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
-class InteractionViewSet(mixins.CreateModelMixin,
+class InteractionViewSet(VisitorIdMixin,
+                         mixins.CreateModelMixin,
                          viewsets.GenericViewSet):
     serializer_class = InteractionSerializer
     permission_classes = [CanPostButNotRead]
@@ -236,12 +475,7 @@ class InteractionViewSet(mixins.CreateModelMixin,
         serializer.is_valid(raise_exception=True)
 
         if request.user.is_anonymous:
-            sid_as_string = request.session.get('session_uid', None)
-            if sid_as_string is None:
-                sid = uuid.uuid4()
-                request.session['session_uid'] = str(sid)
-            else:
-                sid = uuid.UUID(sid_as_string)
+            sid = self.visitor_id(request)
 
         self.perform_create(serializer)
         if request.user.is_anonymous:
@@ -253,9 +487,36 @@ class InteractionViewSet(mixins.CreateModelMixin,
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        # Many interactions in one request, validated in one pass and written with one INSERT
+        if not isinstance(request.data, list):
+            return Response({'non_field_errors': ['Expected a list of interactions.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        limit = get_setting('INTERACTION_BATCH_MAX')
+        if len(request.data) > limit:
+            return Response({'non_field_errors': ['At most %d interactions per batch.' % limit]},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        if request.user.is_anonymous:
+            sid = self.visitor_id(request)
+            owner = {'session_uid': sid, 'user': None}
+        else:
+            owner = {'session_uid': None, 'user': request.user}
+
+        interactions = Interaction.objects.bulk_create([
+            Interaction(**dict(item, **owner)) for item in serializer.validated_data
+        ])
+        stats.incr('interactions.batched', len(interactions))
+        return Response(self.get_serializer(interactions, many=True).data, status=status.HTTP_201_CREATED)
 
 
-class VisitorProfileViewSet(mixins.CreateModelMixin,
+
+class VisitorProfileViewSet(VisitorIdMixin,
+                            mixins.CreateModelMixin,
                             viewsets.GenericViewSet):
     serializer_class = VisitorProfileSerializer
     permission_classes = [CanPostButNotRead]
@@ -268,86 +529,55 @@ class VisitorProfileViewSet(mixins.CreateModelMixin,
         serializer.is_valid(raise_exception=True)
 
         if request.user.is_anonymous:
-            sid_as_string = request.session.get('session_uid', None)
-            if sid_as_string is None:
-                sid = uuid.uuid4()
-                request.session['session_uid'] = str(sid)
-            else:
-                sid = uuid.UUID(sid_as_string)
+            sid = self.visitor_id(request)
 
+        profile = VisitorProfile(**serializer.validated_data)
         if request.user.is_anonymous:
-            profiles = VisitorProfile.objects.filter(session_uid=sid)
-        else:
-            profiles = VisitorProfile.objects.filter(user=request.user)
-
-        if profiles.count() > 0:
-            exists = False
-            for profile in profiles:
-                if (
-                    profile.name == serializer.validated_data['name'] and
-                    profile.family == serializer.validated_data['family'] and
-                    profile.version == serializer.validated_data['version'] and
-                    profile.device == serializer.validated_data['device'] and
-                    profile.os_version == serializer.validated_data['os_version']
-                ):
-                    exists = True
-                    break
-            if exists:
-                return Response([], status=status.HTTP_200_OK)
-            else:
-                self.perform_create(serializer)
-
-                if request.user.is_anonymous:
-                    serializer.instance.session_uid = sid
-                else:
-                    serializer.instance.user = request.user
-
-                serializer.instance.save()
-
-                headers = self.get_success_headers(serializer.data)
-                return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+            profile.session_uid = sid
         else:
-            self.perform_create(serializer)
-
-            if request.user.is_anonymous:
-                serializer.instance.session_uid = sid
-            else:
-                serializer.instance.user = request.user
-
-            serializer.instance.save()
-
-            headers = self.get_success_headers(serializer.data)
-            return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
-
-
-USE_DEFAULTS = False
-
-
-DEFAULTS = {
-    'RSS_FEED_TITLE': 'Blog Feed',
-    'RSS_FEED_LINK': '/blog/',
-    'RSS_FEED_ITEM_DESC_TEMPLATE': 'feed/entries.html'
-}
-
-
-if not hasattr(settings, 'TCB_BLOG_SETTINGS'):
-    USE_DEFAULTS = True
+            profile.user = request.user
+        profile.populate_fingerprint()
 
+        # Already recorded, the fingerprint constraints skipped the insert
+        if not ingest.insert_or_ignore([profile]):
+            return Response([], status=status.HTTP_200_OK)
+        serializer.instance = profile
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
-def get_setting(setting, USE_DEFAULTS):
-    if USE_DEFAULTS:
-        return DEFAULTS.get(setting)
-    else:
-        return settings.TCB_BLOG_SETTINGS.get(setting)
 
 class EntriesFeed(Feed):
     title = get_setting('RSS_FEED_TITLE', USE_DEFAULTS)
     link = get_setting('RSS_FEED_LINK', USE_DEFAULTS)
     description_template = get_setting('RSS_FEED_ITEM_DESC_TEMPLATE', USE_DEFAULTS)
 
+    def __call__(self, request, *args, **kwargs):
+        modified_on, live = EntryHead.objects.watermark()
+        etag = make_etag('rss', modified_on, live, get_current_site(request), request.get_full_path())
+        return conditional_response(request, etag, modified_on, lambda: self.cached_feed(request, etag, *args, **kwargs))
+
+    def cached_feed(self, request, etag, *args, **kwargs):
+        # The etag moves whenever a published head does, so it doubles as the cache key
+        timeout = get_setting('RSS_FEED_CACHE_TIMEOUT')
+        if not timeout:
+            return super().__call__(request, *args, **kwargs)
+
+        key = cache.make_key('rss', etag)
+        cached = cache.shared().get(key)
+        if cached is not None:
+            stats.incr('rss.hit')
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        stats.incr('rss.miss')
+        response = super().__call__(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.shared().set(key, (response.content, response['Content-Type']), timeout)
+        return response
+
     def items(self):
-        return EntryEnvelope.objects.filter(published=True, defunct=False).order_by('-create_date', 'entry_id',
-                                                                     '-version').distinct('create_date', 'entry_id')
+        return EntryEnvelope.objects.published_heads().defer('entry', 'rendered')[:get_setting('RSS_FEED_ITEM_LIMIT')]
+
     def item_title(self, item):
         return item.title
 
@@ -356,19 +586,9 @@ class EntriesFeed(Feed):
 
     def get_context_data(self, item, request, **kwargs):
         context = super().get_context_data(**kwargs)
-        try:
-            current_site = get_current_site(request)
-            first_content_type = item.entry.get('sections')[0].get('contents')[0].get('type')
-            if first_content_type == 'media':
-                value = item.entry.get('sections')[0].get('contents')[0].get('value')
-                if 'http' in value:
-                    desc = '<img src=' + value + '>'
-                else:
-                    desc = '<img src=http://' + str(current_site) + '/' + value + '>'
-            else:
-                desc = '<p>' + item.entry.get('sections')[0].get('contents')[0].get('value') + '</p>'
-        except:
-            desc = ''
+        desc = item.feed_description or ''
+        if desc.startswith(RELATIVE_IMAGE_PREFIX):
+            desc = '<img src=http://' + str(get_current_site(request)) + desc[len(RELATIVE_IMAGE_PREFIX) - 1:]
 
         title = item.title
         readmore_link = self.link + str(item.slug) + '/';